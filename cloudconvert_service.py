@@ -3,219 +3,268 @@ CloudConvert service for video format conversion
 """
 import logging
 import asyncio
+import hashlib
+import hmac
+import os
 import aiohttp
-from config import CLOUDCONVERT_API_KEY
+from aiohttp import web
+from typing import AsyncIterator, Dict
+from config import settings
+from http_session import get_session
 
 logger = logging.getLogger(__name__)
 
+# Job status polling backoff (seconds)
+POLL_INITIAL_DELAY = 2
+POLL_MAX_DELAY = 10
+
+# Converted file download: stream in chunks, no total deadline for large files
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_read=60)
+
 
 class CloudConvertService:
     """Handles video format conversion using CloudConvert API directly"""
     
     def __init__(self):
-        self.api_key = CLOUDCONVERT_API_KEY
+        self.api_key = settings.cloudconvert_api_key
         self.base_url = "https://api.cloudconvert.com/v2"
+        self.webhook_url = settings.cloudconvert_webhook_url
+        self.webhook_secret = settings.cloudconvert_webhook_secret
+        self.pending: Dict[str, asyncio.Future] = {}
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return get_session()
+    
+    @property
+    def headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+    
+    async def _create_job(self) -> dict:
+        """Create an import/upload -> convert -> export/url job"""
+        job_payload = {
+            "tasks": {
+                "import-video": {
+                    "operation": "import/upload"
+                },
+                "convert-video": {
+                    "operation": "convert",
+                    "input": "import-video",
+                    "output_format": "mp4",
+                    "video_codec": "x264",
+                    "audio_codec": "aac"
+                },
+                "export-video": {
+                    "operation": "export/url",
+                    "input": "convert-video"
+                }
+            }
+        }
+        
+        if self.webhook_url:
+            job_payload["webhook_url"] = self.webhook_url
+        
+        async with self.session.post(f"{self.base_url}/jobs", json=job_payload, headers=self.headers) as response:
+            if response.status != 201:
+                error = await response.text()
+                raise Exception(f"Failed to create CloudConvert job: {error}")
+            result = await response.json()
+        
+        logger.info(f"CloudConvert job created: {result['data']['id']}")
+        return result['data']
+    
+    async def _upload(self, job: dict, video_path: str, filename: str):
+        """Upload the source video file to the job's import task"""
+        upload_task = [t for t in job['tasks'] if t['name'] == 'import-video'][0]
+        upload_url = upload_task['result']['form']['url']
+        upload_params = upload_task['result']['form']['parameters']
+        
+        with open(video_path, 'rb') as video_file:
+            form = aiohttp.FormData()
+            for key, value in upload_params.items():
+                form.add_field(key, value)
+            form.add_field('file', video_file, filename=f"{filename}.mp4")
+            
+            async with self.session.post(upload_url, data=form) as upload_response:
+                if upload_response.status not in [200, 201]:
+                    error = await upload_response.text()
+                    raise Exception(f"Failed to upload to CloudConvert: {error}")
+        
+        logger.info("Video uploaded to CloudConvert")
+    
+    async def _get_job(self, job_id: str) -> dict:
+        async with self.session.get(f"{self.base_url}/jobs/{job_id}", headers=self.headers) as status_response:
+            if status_response.status != 200:
+                error = await status_response.text()
+                raise Exception(f"Failed to check job status: {error}")
+            status_result = await status_response.json()
+        
+        return status_result['data']
+    
+    def _check_job(self, job: dict) -> bool:
+        """Return True if the job finished, raise if it failed"""
+        job_status = job['status']
+        logger.info(f"CloudConvert job status: {job_status}")
+        
+        if job_status in ['error', 'failed']:
+            raise Exception(f"CloudConvert job failed: {job.get('message', 'Unknown error')}")
+        
+        return job_status == 'finished'
     
-    async def convert_video_to_mp4(self, video_data: bytes, filename: str = "video") -> bytes:
+    async def _wait_for_job(self, job_id: str) -> dict:
+        """
+        Poll the job until it finishes
+        
+        Polls /jobs/{id} with exponential backoff instead of holding a /wait
+        connection open, which CloudConvert drops with "Idle timeout reached".
+        """
+        delay = POLL_INITIAL_DELAY
+        
+        while True:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_DELAY)
+            
+            job = await self._get_job(job_id)
+            if self._check_job(job):
+                return job
+    
+    async def _wait_for_webhook(self, job_id: str) -> dict:
+        """Wait for the job.finished/job.failed webhook, then fetch the final job"""
+        try:
+            await asyncio.wait_for(self.pending[job_id], timeout=settings.cloudconvert_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"CloudConvert job {job_id} timed out after {settings.cloudconvert_timeout} seconds")
+        finally:
+            self.pending.pop(job_id, None)
+        
+        job = await self._get_job(job_id)
+        if not self._check_job(job):
+            raise Exception(f"CloudConvert job {job_id} not finished after webhook: {job['status']}")
+        return job
+    
+    def _verify_signature(self, body: bytes, signature: str) -> bool:
+        expected = hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+    
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        """aiohttp handler for POST /cloudconvert/webhook"""
+        body = await request.read()
+        
+        if self.webhook_secret and not self._verify_signature(body, request.headers.get('CloudConvert-Signature', '')):
+            logger.warning("CloudConvert webhook rejected: invalid signature")
+            return web.Response(status=401)
+        
+        try:
+            payload = await request.json()
+            job_id = payload['job']['id']
+        except (ValueError, KeyError, TypeError):
+            logger.warning("CloudConvert webhook rejected: malformed payload")
+            return web.Response(status=400)
+        
+        logger.info(f"CloudConvert webhook received: {payload.get('event')} for job {job_id}")
+        
+        future = self.pending.get(job_id)
+        if future and not future.done():
+            future.set_result(payload)
+        
+        return web.Response(status=200)
+    
+    async def _convert(self, video_path: str, filename: str) -> str:
+        """Run a full conversion job and return the exported file URL"""
+        job = await self._create_job()
+        
+        if self.webhook_url:
+            # Register before uploading so a fast webhook can't be missed
+            self.pending[job['id']] = asyncio.get_running_loop().create_future()
+            try:
+                await self._upload(job, video_path, filename)
+            except Exception:
+                self.pending.pop(job['id'], None)
+                raise
+            finished_job = await self._wait_for_webhook(job['id'])
+        else:
+            await self._upload(job, video_path, filename)
+            finished_job = await self._wait_for_job(job['id'])
+        
+        export_task = [t for t in finished_job['tasks'] if t['name'] == 'export-video'][0]
+        return export_task['result']['files'][0]['url']
+    
+    async def convert_video_to_mp4(self, video_path: str, filename: str = "video") -> AsyncIterator[bytes]:
         """
         Convert video to MP4 format with H.264 codec
         
+        The converted file is streamed in chunks instead of being read into
+        a single bytes object, so memory stays O(chunk) regardless of size.
+        
         Args:
-            video_data: Video file as bytes
+            video_path: Path of the source video file
             filename: Original filename (without extension)
         
-        Returns:
-            Converted video as bytes
+        Yields:
+            Converted video in chunks of DOWNLOAD_CHUNK_SIZE bytes
         """
         try:
-            logger.info(f"Starting CloudConvert video conversion: {len(video_data)} bytes")
+            logger.info(f"Starting CloudConvert video conversion: {os.path.getsize(video_path)} bytes")
             
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                job_payload = {
-                    "tasks": {
-                        "import-video": {
-                            "operation": "import/upload"
-                        },
-                        "convert-video": {
-                            "operation": "convert",
-                            "input": "import-video",
-                            "output_format": "mp4",
-                            "video_codec": "x264",
-                            "audio_codec": "aac"
-                        },
-                        "export-video": {
-                            "operation": "export/url",
-                            "input": "convert-video"
-                        }
-                    }
-                }
-                
-                async with session.post(f"{self.base_url}/jobs", json=job_payload, headers=headers) as response:
-                    if response.status != 201:
-                        error = await response.text()
-                        raise Exception(f"Failed to create CloudConvert job: {error}")
-                    result = await response.json()
-                
-                job_id = result['data']['id']
-                logger.info(f"CloudConvert job created: {job_id}")
-                
-                upload_task = [t for t in result['data']['tasks'] if t['name'] == 'import-video'][0]
-                upload_url = upload_task['result']['form']['url']
-                upload_params = upload_task['result']['form']['parameters']
-                
-                form = aiohttp.FormData()
-                for key, value in upload_params.items():
-                    form.add_field(key, value)
-                form.add_field('file', video_data, filename=f"{filename}.mp4")
-                
-                async with session.post(upload_url, data=form) as upload_response:
-                    if upload_response.status not in [200, 201]:
-                        error = await upload_response.text()
-                        raise Exception(f"Failed to upload to CloudConvert: {error}")
-                
-                logger.info("Video uploaded to CloudConvert")
-                
-                while True:
-                    await asyncio.sleep(5)
-                    
-                    async with session.get(f"{self.base_url}/jobs/{job_id}", headers=headers) as status_response:
-                        if status_response.status != 200:
-                            error = await status_response.text()
-                            raise Exception(f"Failed to check job status: {error}")
-                        status_result = await status_response.json()
-                    
-                    job_status = status_result['data']['status']
-                    logger.info(f"CloudConvert job status: {job_status}")
-                    
-                    if job_status == 'finished':
-                        break
-                    elif job_status in ['error', 'failed']:
-                        raise Exception(f"CloudConvert job failed: {status_result['data'].get('message', 'Unknown error')}")
-                
-                export_task = [t for t in status_result['data']['tasks'] if t['name'] == 'export-video'][0]
-                file_url = export_task['result']['files'][0]['url']
-                
-                logger.info(f"Downloading converted video from: {file_url}")
-                
-                async with session.get(file_url) as download_response:
-                    if download_response.status != 200:
-                        error = await download_response.text()
-                        raise Exception(f"Failed to download converted video: {error}")
-                    converted_data = await download_response.read()
+            file_url = await self._convert(video_path, filename)
+            
+            logger.info(f"Downloading converted video from: {file_url}")
+            
+            total = 0
+            async with self.session.get(file_url, timeout=DOWNLOAD_TIMEOUT) as download_response:
+                if download_response.status != 200:
+                    error = await download_response.text()
+                    raise Exception(f"Failed to download converted video: {error}")
                 
-                logger.info(f"Video converted successfully: {len(converted_data)} bytes")
-                return converted_data
+                async for chunk in download_response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    total += len(chunk)
+                    yield chunk
+            
+            logger.info(f"Video converted successfully: {total} bytes")
         
         except Exception as e:
             logger.error(f"CloudConvert conversion failed: {str(e)}")
             raise
     
-    async def convert_video_to_mp4_url(self, video_data: bytes, filename: str = "video") -> str:
+    async def convert_video_to_mp4_url(self, video_path: str, filename: str = "video") -> str:
         """
         Convert video to MP4 and return CloudConvert URL (valid for 24h)
         
         Args:
-            video_data: Video file as bytes
+            video_path: Path of the source video file
             filename: Original filename
         
         Returns:
             Public URL of converted video
         """
         try:
-            logger.info(f"Converting video and getting URL: {len(video_data)} bytes")
+            logger.info(f"Converting video and getting URL: {os.path.getsize(video_path)} bytes")
             
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                job_payload = {
-                    "tasks": {
-                        "import-video": {
-                            "operation": "import/upload"
-                        },
-                        "convert-video": {
-                            "operation": "convert",
-                            "input": "import-video",
-                            "output_format": "mp4",
-                            "video_codec": "x264",
-                            "audio_codec": "aac"
-                        },
-                        "export-video": {
-                            "operation": "export/url",
-                            "input": "convert-video"
-                        }
-                    }
-                }
-                
-                async with session.post(f"{self.base_url}/jobs", json=job_payload, headers=headers) as response:
-                    if response.status != 201:
-                        error = await response.text()
-                        raise Exception(f"Failed to create CloudConvert job: {error}")
-                    result = await response.json()
-                
-                job_id = result['data']['id']
-                
-                upload_task = [t for t in result['data']['tasks'] if t['name'] == 'import-video'][0]
-                upload_url = upload_task['result']['form']['url']
-                upload_params = upload_task['result']['form']['parameters']
-                
-                form = aiohttp.FormData()
-                for key, value in upload_params.items():
-                    form.add_field(key, value)
-                form.add_field('file', video_data, filename=f"{filename}.mp4")
-                
-                async with session.post(upload_url, data=form) as upload_response:
-                    if upload_response.status not in [200, 201]:
-                        error = await upload_response.text()
-                        raise Exception(f"Failed to upload: {error}")
-                
-                logger.info("Video uploaded to CloudConvert")
-                
-                while True:
-                    await asyncio.sleep(5)
-                    
-                    async with session.get(f"{self.base_url}/jobs/{job_id}", headers=headers) as status_response:
-                        if status_response.status != 200:
-                            raise Exception("Failed to check job status")
-                        status_result = await status_response.json()
-                    
-                    job_status = status_result['data']['status']
-                    logger.info(f"CloudConvert job status: {job_status}")
-                    
-                    if job_status == 'finished':
-                        break
-                    elif job_status in ['error', 'failed']:
-                        raise Exception(f"CloudConvert job failed")
-                
-                export_task = [t for t in status_result['data']['tasks'] if t['name'] == 'export-video'][0]
-                file_url = export_task['result']['files'][0]['url']
-                
-                logger.info(f"Video URL ready (valid 24h): {file_url}")
-                return file_url
+            file_url = await self._convert(video_path, filename)
+            
+            logger.info(f"Video URL ready (valid 24h): {file_url}")
+            return file_url
         
         except Exception as e:
             logger.error(f"CloudConvert URL generation failed: {str(e)}")
             raise
     
-    async def convert_and_get_url(self, video_data: bytes) -> str:
+    async def convert_and_get_url(self, video_path: str) -> str:
         """
         Alias for convert_video_to_mp4_url
         Upload video and get public URL (valid 24h)
         
         Args:
-            video_data: Video file as bytes
+            video_path: Path of the source video file
         
         Returns:
             Public URL of converted video
         """
-        return await self.convert_video_to_mp4_url(video_data, "final_video")
+        return await self.convert_video_to_mp4_url(video_path, "final_video")
 
 
 def create_cloudconvert_service() -> CloudConvertService:
@@ -1,63 +1,232 @@
 import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
-load_dotenv()
+if not os.getenv('CONFIG_LOADED'):
+    load_dotenv()
+    os.environ['CONFIG_LOADED'] = '1'
 
-TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-SOURCE_CHANNEL_ID = int(os.getenv('SOURCE_CHANNEL_ID', '-1003579454785'))
-CHANNEL_ID = int(os.getenv('CHANNEL_ID', '-1003579454785'))
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
-DEEPL_API_KEY = os.getenv('DEEPL_API_KEY')
-CLOUDCONVERT_API_KEY = os.getenv('CLOUDCONVERT_API_KEY')
+def _writable_dir(path: str) -> Optional[str]:
+    """path if it's an existing writable directory, else None (use the system temp dir)"""
+    return path if path and os.path.isdir(path) and os.access(path, os.W_OK) else None
 
-HEYGEN_API_KEY = os.getenv('HEYGEN_API_KEY')
-HEYGEN_TIMEOUT = 600
-HEYGEN_POLL_INTERVAL = 10
 
-UPLOADPOST_API_TOKEN = os.getenv('UPLOADPOST_API_TOKEN')
-UPLOADPOST_PROFILE = os.getenv('UPLOADPOST_PROFILE')
-UPLOADPOST_API_URL = os.getenv('UPLOADPOST_API_URL', 'https://api.upload-post.com/api/upload')
-
-# Subtitle configuration - Customizable per user
-# IMPORTANT: Use font names as registered in fontconfig
-SUBTITLE_FONT = os.getenv('SUBTITLE_FONT', 'Montserrat')  # ✅ IL MIGLIORE!
-SUBTITLE_FONT_SIZE = int(os.getenv('SUBTITLE_FONT_SIZE', '12'))
-SUBTITLE_COLOR = os.getenv('SUBTITLE_COLOR', '&H00FFFFFF')  # White in ASS format
-SUBTITLE_OUTLINE_COLOR = os.getenv('SUBTITLE_OUTLINE_COLOR', '&H00000000')  # Black
-SUBTITLE_OUTLINE_WIDTH = int(os.getenv('SUBTITLE_OUTLINE_WIDTH', '1'))
-SUBTITLE_MARGIN_V = int(os.getenv('SUBTITLE_MARGIN_V', '100'))
-SUBTITLE_WORDS_PER_CHUNK = int(os.getenv('SUBTITLE_WORDS_PER_CHUNK', '2'))
-
-SUBTITLE_POSITION = "bottom-center"
-SUBTITLE_MAX_WORDS_PER_LINE = 2
-
-CAROUSEL_WAIT_TIMEOUT = 30
-MAX_CAROUSEL_ITEMS = 10
-CAPTION_MAX_LENGTH = 2200
-
-MAX_RETRIES = 3
-RETRY_DELAY = 1
-
-LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Application settings, read from the environment once at import"""
+    
+    telegram_bot_token: str
+    source_channel_id: int
+    channel_id: int
+    
+    openai_api_key: str
+    groq_api_key: str
+    deepl_api_key: str
+    cloudconvert_api_key: str
+    cloudconvert_timeout: int
+    
+    # Optional CloudConvert webhook (public URL routed to the bot's webhook server)
+    cloudconvert_webhook_url: str
+    cloudconvert_webhook_secret: str
+    webhook_port: int
+    
+    heygen_api_key: str
+    heygen_timeout: int
+    heygen_poll_interval: int
+    
+    # Work files (source/translated/final video, subtitle script); None = system temp dir
+    temp_dir: Optional[str]
+    
+    # Content-addressed cache of translated videos (empty string disables it)
+    video_cache_dir: str
+    video_cache_max_bytes: int
+    # Whisper transcripts keyed by audio hash (empty string disables it)
+    transcript_cache_dir: str
+    transcript_cache_ttl: int
+    # Transcription backend: groq (API) or local (faster-whisper, optional dependency)
+    whisper_backend: str
+    whisper_local_model: str
+    whisper_device: str
+    whisper_compute_type: str
+    # Audio longer than this is split and the pieces transcribed in parallel (0 disables)
+    whisper_segment_seconds: int
+    
+    uploadpost_api_token: str
+    uploadpost_profile: str
+    uploadpost_api_url: str
+    
+    # Subtitle configuration - Customizable per user
+    # IMPORTANT: Use font names as registered in fontconfig
+    subtitle_font: str
+    subtitle_font_size: int
+    subtitle_color: str  # ASS format (&HAABBGGRR)
+    subtitle_outline_color: str
+    subtitle_outline_width: int
+    subtitle_margin_v: int
+    subtitle_words_per_chunk: int
+    # Reading-speed chunking: grow chunks until readable (0 keeps fixed words-per-chunk)
+    subtitle_max_cps: float
+    subtitle_max_chars: int
+    # Directory libass loads fonts from directly (the Dockerfile installs them here)
+    subtitle_fonts_dir: str
+    
+    # H.264 encoder for subtitle burn-in: auto, libx264, h264_nvenc, h264_qsv, h264_vaapi, h264_videotoolbox
+    video_encoder: str
+    vaapi_device: str
+    # libx264 speed/size trade-off (output is bitrate-capped either way)
+    x264_preset: str
+    
+    subtitle_position: str
+    subtitle_max_words_per_line: int
+    
+    carousel_wait_timeout: int
+    carousel_max_wait: int  # cap on total debounce time from the first item
+    max_carousel_items: int
+    # Unpublished carousel groups are dropped after this long / beyond this many
+    carousel_state_ttl: int
+    max_pending_carousels: int
+    
+    # Max in-flight requests per external API
+    max_concurrent_downloads: int  # Telegram get_file/download
+    deepl_max_concurrency: int
+    openai_max_concurrency: int
+    heygen_max_concurrency: int
+    cloudconvert_max_concurrency: int
+    uploadpost_max_concurrency: int
+    whisper_max_concurrency: int
+    ffmpeg_max_concurrency: int  # each libx264 encode can hold hundreds of MB
+    # Reel jobs: a bounded queue drained by a fixed pool of workers
+    video_workers: int
+    video_queue_size: int
+    caption_max_length: int
+    caption_cache_size: int
+    
+    # Per-attempt time budgets (seconds); a timeout counts as a failed, retriable attempt
+    caption_translation_timeout: int
+    cloudconvert_stage_timeout: int
+    heygen_stage_timeout: int
+    # ffmpeg and Whisper budgets start once their concurrency slot is held, so queueing is free
+    ffmpeg_timeout: int
+    whisper_timeout: int
+    publish_timeout: int
+    
+    max_retries: int
+    retry_delay: int
+    
+    log_level: str
+    
+    @classmethod
+    def from_env(cls) -> 'Settings':
+        env = os.environ
+        return cls(
+            telegram_bot_token=env.get('TELEGRAM_BOT_TOKEN'),
+            source_channel_id=int(env.get('SOURCE_CHANNEL_ID', '-1003579454785')),
+            channel_id=int(env.get('CHANNEL_ID', '-1003579454785')),
+            
+            openai_api_key=env.get('OPENAI_API_KEY'),
+            groq_api_key=env.get('GROQ_API_KEY'),
+            deepl_api_key=env.get('DEEPL_API_KEY'),
+            cloudconvert_api_key=env.get('CLOUDCONVERT_API_KEY'),
+            cloudconvert_timeout=600,
+            
+            cloudconvert_webhook_url=env.get('CLOUDCONVERT_WEBHOOK_URL'),
+            cloudconvert_webhook_secret=env.get('CLOUDCONVERT_WEBHOOK_SECRET'),
+            webhook_port=int(env.get('PORT', '8080')),
+            
+            heygen_api_key=env.get('HEYGEN_API_KEY'),
+            heygen_timeout=600,
+            heygen_poll_interval=10,
+            
+            temp_dir=_writable_dir(env.get('TEMP_DIR', '')),
+            
+            video_cache_dir=env.get('VIDEO_CACHE_DIR', ''),
+            video_cache_max_bytes=int(env.get('VIDEO_CACHE_MAX_MB', '5120')) * 1024 * 1024,
+            transcript_cache_dir=env.get('TRANSCRIPT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ig-clone', 'transcripts')),
+            transcript_cache_ttl=7 * 24 * 3600,
+            whisper_backend=env.get('WHISPER_BACKEND', 'groq'),
+            whisper_local_model=env.get('WHISPER_LOCAL_MODEL', 'large-v3-turbo'),
+            whisper_device=env.get('WHISPER_DEVICE', 'auto'),
+            whisper_compute_type=env.get('WHISPER_COMPUTE_TYPE', 'int8'),
+            whisper_segment_seconds=int(env.get('WHISPER_SEGMENT_SECONDS', '600')),
+            
+            uploadpost_api_token=env.get('UPLOADPOST_API_TOKEN'),
+            uploadpost_profile=env.get('UPLOADPOST_PROFILE'),
+            uploadpost_api_url=env.get('UPLOADPOST_API_URL', 'https://api.upload-post.com/api/upload'),
+            
+            subtitle_font=env.get('SUBTITLE_FONT', 'Montserrat'),  # ✅ IL MIGLIORE!
+            subtitle_font_size=int(env.get('SUBTITLE_FONT_SIZE', '12')),
+            subtitle_color=env.get('SUBTITLE_COLOR', '&H00FFFFFF'),  # White
+            subtitle_outline_color=env.get('SUBTITLE_OUTLINE_COLOR', '&H00000000'),  # Black
+            subtitle_outline_width=int(env.get('SUBTITLE_OUTLINE_WIDTH', '1')),
+            subtitle_margin_v=int(env.get('SUBTITLE_MARGIN_V', '100')),
+            subtitle_words_per_chunk=int(env.get('SUBTITLE_WORDS_PER_CHUNK', '2')),
+            subtitle_max_cps=float(env.get('SUBTITLE_MAX_CPS', '0')),
+            subtitle_max_chars=int(env.get('SUBTITLE_MAX_CHARS', '42')),
+            subtitle_fonts_dir=env.get('SUBTITLE_FONTS_DIR', '/usr/share/fonts/truetype/custom'),
+            
+            video_encoder=env.get('VIDEO_ENCODER', 'auto'),
+            vaapi_device=env.get('VAAPI_DEVICE', '/dev/dri/renderD128'),
+            x264_preset=env.get('X264_PRESET', 'veryfast'),
+            
+            subtitle_position="bottom-center",
+            subtitle_max_words_per_line=2,
+            
+            carousel_wait_timeout=30,
+            carousel_max_wait=120,
+            max_carousel_items=10,
+            carousel_state_ttl=3600,
+            max_pending_carousels=256,
+            
+            max_concurrent_downloads=5,
+            deepl_max_concurrency=5,
+            openai_max_concurrency=8,
+            heygen_max_concurrency=2,
+            cloudconvert_max_concurrency=4,
+            uploadpost_max_concurrency=4,
+            whisper_max_concurrency=int(env.get('WHISPER_MAX_CONCURRENCY', '4')),
+            ffmpeg_max_concurrency=int(env.get('FFMPEG_MAX_CONCURRENCY', str(os.cpu_count() or 1))),
+            video_workers=int(env.get('VIDEO_WORKERS', '4')),
+            video_queue_size=int(env.get('VIDEO_QUEUE_SIZE', '8')),
+            caption_max_length=2200,
+            caption_cache_size=2048,
+            
+            caption_translation_timeout=120,
+            cloudconvert_stage_timeout=900,
+            heygen_stage_timeout=900,
+            ffmpeg_timeout=900,
+            whisper_timeout=180,
+            publish_timeout=600,
+            
+            max_retries=3,
+            retry_delay=1,
+            
+            log_level=env.get('LOG_LEVEL', 'INFO')
+        )
+    
+    def validate(self) -> bool:
+        required_vars = {
+            'TELEGRAM_BOT_TOKEN': self.telegram_bot_token,
+            'OPENAI_API_KEY': self.openai_api_key,
+            'DEEPL_API_KEY': self.deepl_api_key,
+            'CLOUDCONVERT_API_KEY': self.cloudconvert_api_key,
+            'HEYGEN_API_KEY': self.heygen_api_key,
+            'UPLOADPOST_API_TOKEN': self.uploadpost_api_token,
+            'UPLOADPOST_PROFILE': self.uploadpost_profile,
+        }
+        
+        # Local transcription (faster-whisper) doesn't call Groq
+        if self.whisper_backend != 'local':
+            required_vars['GROQ_API_KEY'] = self.groq_api_key
+        
+        missing = [var for var, value in required_vars.items() if not value]
+        
+        if missing:
+            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+        
+        return True
 
 
-def validate_config():
-    required_vars = {
-        'TELEGRAM_BOT_TOKEN': TELEGRAM_BOT_TOKEN,
-        'OPENAI_API_KEY': OPENAI_API_KEY,
-        'GROQ_API_KEY': GROQ_API_KEY,
-        'DEEPL_API_KEY': DEEPL_API_KEY,
-        'CLOUDCONVERT_API_KEY': CLOUDCONVERT_API_KEY,
-        'HEYGEN_API_KEY': HEYGEN_API_KEY,
-        'UPLOADPOST_API_TOKEN': UPLOADPOST_API_TOKEN,
-        'UPLOADPOST_PROFILE': UPLOADPOST_PROFILE,
-    }
-    
-    missing = [var for var, value in required_vars.items() if not value]
-    
-    if missing:
-        raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
-    
-    return True
+settings = Settings.from_env()
@@ -1,8 +1,14 @@
 import logging
 import asyncio
-from typing import Dict, List, Tuple, Optional
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Awaitable, Callable, Dict, List, Set, Tuple, Optional
 from telegram import Bot, Message
-from io import BytesIO
 
 from error_handler import ErrorHandler
 from translation_service import TranslationService
@@ -10,10 +16,49 @@ from heygen_service import HeyGenService
 from cloudconvert_service import CloudConvertService
 from subtitle_service import SubtitleService
 from uploadpost_service import UploadPostService
-from config import CAROUSEL_WAIT_TIMEOUT, MAX_CAROUSEL_ITEMS, CAPTION_MAX_LENGTH
+from video_cache import VideoCache
+from http_session import get_session
+from config import settings
 
 logger = logging.getLogger(__name__)
 
+# HeyGen result download: large chunks keep per-chunk write/await overhead low
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+
+def _limited(semaphore: asyncio.Semaphore, func: Callable) -> Callable:
+    """Wrap an async function so each call holds semaphore while it runs"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with semaphore:
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def _timed(seconds: float, func: Callable) -> Callable:
+    """Wrap an async function so each call raises TimeoutError after seconds"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with asyncio.timeout(seconds):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+@dataclass(slots=True)
+class CarouselState:
+    """Everything known about one pending media group"""
+    caption: str
+    created_at: float = field(default_factory=time.monotonic)
+    # (download task, media_type), downloads start as each item arrives
+    items: List[Tuple[asyncio.Task, str]] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    
+    def cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
 
 class ContentProcessor:
     
@@ -25,7 +70,8 @@ class ContentProcessor:
         heygen_service: HeyGenService,
         cloudconvert_service: CloudConvertService,
         subtitle_service: SubtitleService,
-        uploadpost_service: UploadPostService
+        uploadpost_service: UploadPostService,
+        video_cache: Optional[VideoCache] = None
     ):
         self.bot = bot
         self.error_handler = error_handler
@@ -34,10 +80,74 @@ class ContentProcessor:
         self.cloudconvert = cloudconvert_service
         self.subtitle = subtitle_service
         self.uploadpost = uploadpost_service
+        self.video_cache = video_cache
+        
+        # media_group_id -> pending carousel, insertion-ordered (oldest first)
+        self.carousels: Dict[str, CarouselState] = {}
+        self.carousel_gc_task: Optional[asyncio.Task] = None
+        self.background_tasks: Set[asyncio.Task] = set()
+        
+        # Reels go through a bounded queue: each worker owns one job (and its work dir) at a
+        # time, and the per-API semaphores below let different jobs overlap across stages
+        self.video_queue: asyncio.Queue[Message] = asyncio.Queue(maxsize=settings.video_queue_size)
+        self.video_workers: List[asyncio.Task] = []
+        
+        # One semaphore per external API so bursts queue here instead of hitting 429s
+        self.sem_telegram = asyncio.Semaphore(settings.max_concurrent_downloads)
+        self.sem_deepl = asyncio.Semaphore(settings.deepl_max_concurrency)
+        self.sem_openai = asyncio.Semaphore(settings.openai_max_concurrency)
+        self.sem_heygen = asyncio.Semaphore(settings.heygen_max_concurrency)
+        self.sem_cloudconvert = asyncio.Semaphore(settings.cloudconvert_max_concurrency)
+        self.sem_uploadpost = asyncio.Semaphore(settings.uploadpost_max_concurrency)
+        
+        # LRU of translated captions keyed by blake2b digest of target language + caption;
+        # concurrent misses for the same key share one in-flight translation
+        self.caption_cache: OrderedDict[bytes, str] = OrderedDict()
+        self.caption_inflight: Dict[bytes, asyncio.Task] = {}
+        
+        # Retry-wrapped operations, built once instead of per message
+        self._translate_caption = self.error_handler.with_retry(
+            module_name="CaptionTranslation",
+            scenario="Translating caption",
+            fallback_func=self._translate_caption_fallback
+        )(_limited(self.sem_deepl, _timed(settings.caption_translation_timeout, self.translation.translate_caption)))
         
-        self.carousel_groups: Dict[str, List[Tuple[bytes, str]]] = {}
-        self.carousel_captions: Dict[str, str] = {}
-        self.carousel_timers: Dict[str, asyncio.Task] = {}
+        self._publish_photo = self.error_handler.with_retry(
+            module_name="InstagramPublish",
+            scenario="Publishing photo to Instagram"
+        )(_limited(self.sem_uploadpost, _timed(settings.publish_timeout, self.uploadpost.publish_photo)))
+        
+        self._publish_photo_carousel = self.error_handler.with_retry(
+            module_name="InstagramPublish",
+            scenario="Publishing photo carousel to Instagram"
+        )(_limited(self.sem_uploadpost, _timed(settings.publish_timeout, self.uploadpost.publish_carousel)))
+        
+        self._publish_mixed_carousel = self.error_handler.with_retry(
+            module_name="InstagramPublish",
+            scenario="Publishing mixed/video carousel to Instagram"
+        )(_limited(self.sem_uploadpost, _timed(settings.publish_timeout, self.uploadpost.publish_mixed_carousel)))
+        
+        self._publish_reel = self.error_handler.with_retry(
+            module_name="InstagramPublish",
+            scenario="Publishing reel to Instagram"
+        )(_limited(self.sem_uploadpost, _timed(settings.publish_timeout, self._publish_reel_file)))
+        
+        self._convert_video = self.error_handler.with_retry(
+            module_name="CloudConvert",
+            scenario="Converting video to MP4 and getting URL"
+        )(_limited(self.sem_cloudconvert, _timed(settings.cloudconvert_stage_timeout, self.cloudconvert.convert_video_to_mp4_url)))
+        
+        self._heygen_translate = self.error_handler.with_retry(
+            module_name="HeyGenTranslation",
+            scenario="Translating video with HeyGen"
+        )(_limited(self.sem_heygen, _timed(settings.heygen_stage_timeout, self.heygen.translate_video)))
+        
+        # No stage-wide timer here: SubtitleService waits on its own ffmpeg/Whisper slots and
+        # budgets each run only once the slot is held (ffmpeg_timeout, whisper_timeout)
+        self._add_subtitles = self.error_handler.with_retry(
+            module_name="SubtitleGeneration",
+            scenario="Adding subtitles to translated video"
+        )(self.subtitle.add_subtitles_to_file)
     
     async def process_message(self, message: Message):
         try:
@@ -46,41 +156,73 @@ class ContentProcessor:
             elif message.photo and message.caption:
                 await self.process_photo_with_caption(message)
             elif message.video and message.caption:
-                await self.process_video_with_caption(message)
+                await self.video_queue.put(message)
+                logger.info(f"Video {message.message_id} queued ({self.video_queue.qsize()} waiting)")
             else:
                 logger.warning(f"Unsupported message type: {message}")
         
         except Exception as e:
             logger.error(f"Error processing message {message.message_id}: {str(e)}")
     
+    async def _cached_translation(self, caption: str, translate: Callable[[str], Awaitable[str]]) -> str:
+        """Return a cached translation of caption, or translate it and cache the result"""
+        key = hashlib.blake2b(
+            f"{self.translation.target_lang}\0{caption}".encode('utf-8'), digest_size=16
+        ).digest()
+        
+        if key in self.caption_cache:
+            self.caption_cache.move_to_end(key)
+            logger.info("Caption translation cache hit")
+            return self.caption_cache[key]
+        
+        task = self.caption_inflight.get(key)
+        if task:
+            logger.info("Caption translation already in flight, waiting for it")
+            return await asyncio.shield(task)
+        
+        task = asyncio.ensure_future(translate(caption))
+        # Shielded: it outlives a cancelled caller, so its failure may have no one left to retrieve it
+        task.add_done_callback(self._consume_exception)
+        self.caption_inflight[key] = task
+        try:
+            translated = await asyncio.shield(task)
+        finally:
+            self.caption_inflight.pop(key, None)
+        
+        self.caption_cache[key] = translated
+        if len(self.caption_cache) > settings.caption_cache_size:
+            self.caption_cache.popitem(last=False)
+        
+        return translated
+    
+    @staticmethod
+    def _fit_caption(caption: str) -> str:
+        """Truncate caption to caption_max_length UTF-16 code units (how Instagram counts)"""
+        encoded = caption.encode('utf-16-le')
+        if len(encoded) <= 2 * settings.caption_max_length:
+            return caption
+        
+        logger.warning(f"Caption truncated to {settings.caption_max_length} UTF-16 code units")
+        # errors='ignore' drops a surrogate pair split by the cut
+        return encoded[:2 * (settings.caption_max_length - 3)].decode('utf-16-le', errors='ignore') + "..."
+    
+    async def _translate_caption_fallback(self, caption: str) -> str:
+        async with self.sem_openai, asyncio.timeout(settings.caption_translation_timeout):
+            return await self.translation.translate_caption_openai_fallback(caption)
+    
     async def process_photo_with_caption(self, message: Message):
         logger.info(f"Processing single photo: {message.message_id}")
         
         try:
-            photo = message.photo[-1]
-            file = await self.bot.get_file(photo.file_id)
-            photo_data = await file.download_as_bytearray()
+            photo_data = await self._download_file(message.photo[-1].file_id)
             
             logger.info(f"Photo downloaded: {len(photo_data)} bytes")
             
-            translate_with_retry = self.error_handler.with_retry(
-                module_name="CaptionTranslation",
-                scenario="Translating photo caption",
-                fallback_func=lambda: self.translation.translate_caption_openai_fallback(message.caption)
-            )(self.translation.translate_caption)
+            translated_caption = await self._cached_translation(message.caption, self._translate_caption)
             
-            translated_caption = await translate_with_retry(message.caption)
+            translated_caption = self._fit_caption(translated_caption)
             
-            if len(translated_caption) > CAPTION_MAX_LENGTH:
-                translated_caption = translated_caption[:CAPTION_MAX_LENGTH-3] + "..."
-                logger.warning(f"Caption truncated to {CAPTION_MAX_LENGTH} characters")
-            
-            publish_with_retry = self.error_handler.with_retry(
-                module_name="InstagramPublish",
-                scenario="Publishing photo to Instagram"
-            )(self.uploadpost.publish_photo)
-            
-            await publish_with_retry(bytes(photo_data), translated_caption, "photo.jpg")
+            await self._publish_photo(photo_data, translated_caption, "photo.jpg")
             
             logger.info("Photo published successfully to Instagram")
         
@@ -93,85 +235,200 @@ class ContentProcessor:
         
         logger.info(f"Processing carousel item: group {media_group_id}")
         
-        if media_group_id not in self.carousel_groups:
-            self.carousel_groups[media_group_id] = []
-            self.carousel_captions[media_group_id] = message.caption or ""
+        state = self.carousels.get(media_group_id)
+        if state is None:
+            self._evict_stale_carousels()
+            state = self.carousels[media_group_id] = CarouselState(caption=message.caption or "")
             logger.info(f"New carousel group started: {media_group_id}")
         
         if message.photo:
-            photo = message.photo[-1]
-            file = await self.bot.get_file(photo.file_id)
-            media_data = await file.download_as_bytearray()
+            file_id = message.photo[-1].file_id
             media_type = 'photo'
-            logger.info(f"Carousel photo added: {len(media_data)} bytes")
         elif message.video:
-            file = await self.bot.get_file(message.video.file_id)
-            media_data = await file.download_as_bytearray()
+            file_id = message.video.file_id
             media_type = 'video'
-            logger.info(f"Carousel video added: {len(media_data)} bytes")
         else:
             logger.warning(f"Unsupported carousel media type in message {message.message_id}")
             return
         
-        self.carousel_groups[media_group_id].append((bytes(media_data), media_type))
+        # Download while the debounce window is still open
+        download = asyncio.create_task(self._download_file(file_id))
+        download.add_done_callback(self._consume_exception)
+        state.items.append((download, media_type))
         
-        logger.info(f"Carousel item added: {len(self.carousel_groups[media_group_id])}/{MAX_CAROUSEL_ITEMS}")
+        item_count = len(state.items)
+        logger.info(f"Carousel item added: {item_count}/{settings.max_carousel_items}")
         
-        if media_group_id in self.carousel_timers:
-            self.carousel_timers[media_group_id].cancel()
-            logger.info(f"Cancelled previous timer for carousel {media_group_id}")
+        if state.timer:
+            state.cancel_timer()
+            logger.info(f"Reset timer for carousel {media_group_id}")
         
-        async def delayed_publish():
+        # Telegram albums hold at most max_carousel_items: nothing more to wait for
+        if item_count >= settings.max_carousel_items:
+            logger.info(f"Carousel {media_group_id} is full, publishing now")
+            self._flush_carousel(media_group_id)
+            return
+        
+        # Debounce, but never past carousel_max_wait from the first item
+        elapsed = time.monotonic() - state.created_at
+        delay = max(0, min(settings.carousel_wait_timeout, settings.carousel_max_wait - elapsed))
+        
+        state.timer = asyncio.get_running_loop().call_later(
+            delay, self._flush_carousel, media_group_id
+        )
+        logger.info(f"Started new timer ({delay:.0f}s) for carousel {media_group_id}")
+    
+    @staticmethod
+    def _consume_exception(task: asyncio.Task):
+        # Mark failures as retrieved; they are reported where the task is awaited
+        if not task.cancelled():
+            task.exception()
+    
+    @staticmethod
+    def _release_carousel(state: CarouselState):
+        state.cancel_timer()
+        for download, _ in state.items:
+            download.cancel()
+    
+    def _discard_carousel(self, media_group_id: str):
+        state = self.carousels.pop(media_group_id, None)
+        if state is not None:
+            self._release_carousel(state)
+    
+    def _evict_stale_carousels(self):
+        """Drop carousel groups that never published (TTL expired or too many pending)"""
+        now = time.monotonic()
+        
+        for media_group_id, state in list(self.carousels.items()):
+            expired = now - state.created_at > settings.carousel_state_ttl
+            if not expired and len(self.carousels) < settings.max_pending_carousels:
+                break
+            
+            # Skip groups currently being published
+            if state.lock.locked():
+                continue
+            
+            logger.warning(f"Evicting unpublished carousel {media_group_id} ({len(state.items)} items)")
+            self._discard_carousel(media_group_id)
+    
+    async def _carousel_gc(self):
+        """Periodically evict stale groups, even when no new carousels arrive"""
+        while True:
+            await asyncio.sleep(settings.carousel_wait_timeout * 3)
+            self._evict_stale_carousels()
+    
+    def start(self):
+        """Start background maintenance (call from inside the running event loop)"""
+        if self.carousel_gc_task is None or self.carousel_gc_task.done():
+            self.carousel_gc_task = asyncio.create_task(self._carousel_gc())
+        
+        if not self.video_workers:
+            self.video_workers = [
+                asyncio.create_task(self._video_worker()) for _ in range(settings.video_workers)
+            ]
+    
+    async def _video_worker(self):
+        """Process queued reels one at a time until cancelled"""
+        while True:
+            message = await self.video_queue.get()
             try:
-                await asyncio.sleep(CAROUSEL_WAIT_TIMEOUT)
-                logger.info(f"Timer expired for carousel {media_group_id}, publishing now")
-                if media_group_id in self.carousel_groups:
-                    await self.publish_carousel(media_group_id)
-            except asyncio.CancelledError:
-                logger.info(f"Timer cancelled for carousel {media_group_id}")
-        
-        self.carousel_timers[media_group_id] = asyncio.create_task(delayed_publish())
-        logger.info(f"Started new timer ({CAROUSEL_WAIT_TIMEOUT}s) for carousel {media_group_id}")
+                await self.process_video_with_caption(message)
+            except Exception as e:
+                logger.error(f"Error processing video {message.message_id}: {str(e)}")
+            finally:
+                self.video_queue.task_done()
+    
+    async def close(self):
+        """Stop background maintenance and workers, cancel in-flight carousel publishes"""
+        tasks = list(self.background_tasks) + self.video_workers
+        self.video_workers = []
+        if self.carousel_gc_task:
+            tasks.append(self.carousel_gc_task)
+        
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        for media_group_id in list(self.carousels):
+            self._discard_carousel(media_group_id)
+    
+    def _flush_carousel(self, media_group_id: str):
+        """Publish the carousel in a background task (debounce timer or full group)"""
+        logger.info(f"Flushing carousel {media_group_id}")
+        task = asyncio.create_task(self.publish_carousel(media_group_id))
+        self.background_tasks.add(task)
+        task.add_done_callback(self._on_background_task_done)
+    
+    def _on_background_task_done(self, task: asyncio.Task):
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background task failed: {task.exception()}")
+    
+    async def _download_file(self, file_id: str) -> bytearray:
+        async with self.sem_telegram:
+            file = await self.bot.get_file(file_id)
+            return await file.download_as_bytearray()
+    
+    async def _download_to_path(self, file_id: str, path: str) -> str:
+        """Stream a Telegram file straight to disk instead of into memory"""
+        async with self.sem_telegram:
+            file = await self.bot.get_file(file_id)
+            await file.download_to_drive(path)
+        return path
     
     async def publish_carousel(self, media_group_id: str):
-        if media_group_id not in self.carousel_groups:
+        state = self.carousels.get(media_group_id)
+        if state is None:
             return
         
-        items = self.carousel_groups[media_group_id]
-        caption = self.carousel_captions.get(media_group_id, "")
+        async with state.lock:
+            # Already published (or evicted) by a concurrent flush
+            if self.carousels.get(media_group_id) is not state:
+                return
+            
+            # Detach the group before publishing: an item arriving meanwhile starts a new
+            # group instead of being appended after the downloads were gathered
+            del self.carousels[media_group_id]
+            state.cancel_timer()
+            
+            try:
+                await self._publish_carousel(media_group_id, state)
+            finally:
+                # Nothing re-triggers a failed publish: release the downloaded media either way
+                self._release_carousel(state)
+    
+    async def _publish_carousel(self, media_group_id: str, state: CarouselState):
+        item_refs = state.items
+        caption = state.caption
         
-        has_photos = any(item_type == 'photo' for _, item_type in items)
-        has_videos = any(item_type == 'video' for _, item_type in items)
+        has_photos = any(item_type == 'photo' for _, item_type in item_refs)
+        has_videos = any(item_type == 'video' for _, item_type in item_refs)
         
-        logger.info(f"Publishing carousel: {len(items)} items (photos: {has_photos}, videos: {has_videos})")
+        logger.info(f"Publishing carousel: {len(item_refs)} items (photos: {has_photos}, videos: {has_videos})")
         
         try:
+            # Finish any outstanding downloads and translate the caption concurrently
+            downloads = asyncio.gather(*(download for download, _ in item_refs))
             if caption:
-                translate_with_retry = self.error_handler.with_retry(
-                    module_name="CaptionTranslation",
-                    scenario="Translating carousel caption",
-                    fallback_func=lambda: self.translation.translate_caption_openai_fallback(caption)
-                )(self.translation.translate_caption)
-                
-                translated_caption = await translate_with_retry(caption)
+                media, translated_caption = await asyncio.gather(
+                    downloads, self._cached_translation(caption, self._translate_caption)
+                )
             else:
-                translated_caption = ""
+                media, translated_caption = await downloads, ""
+            
+            items = [(data, media_type) for data, (_, media_type) in zip(media, item_refs)]
+            
+            logger.info(f"Carousel media downloaded: {sum(len(data) for data in media)} bytes")
             
-            if len(translated_caption) > CAPTION_MAX_LENGTH:
-                translated_caption = translated_caption[:CAPTION_MAX_LENGTH-3] + "..."
+            translated_caption = self._fit_caption(translated_caption)
             
             if has_videos and has_photos:
                 logger.info("Publishing MIXED carousel (photos + videos)")
                 logger.info(f"Items to publish: {[(media_type, len(data)) for data, media_type in items]}")
                 
                 try:
-                    publish_with_retry = self.error_handler.with_retry(
-                        module_name="InstagramPublish",
-                        scenario="Publishing mixed carousel to Instagram"
-                    )(self.uploadpost.publish_mixed_carousel)
-                    
                     logger.info("Calling publish_mixed_carousel...")
-                    result = await publish_with_retry(items, translated_caption)
+                    result = await self._publish_mixed_carousel(items, translated_caption)
                     logger.info(f"publish_mixed_carousel returned: {result}")
                     
                 except Exception as e:
@@ -184,13 +441,8 @@ class ContentProcessor:
                 logger.info(f"Items to publish: {[(media_type, len(data)) for data, media_type in items]}")
                 
                 try:
-                    publish_with_retry = self.error_handler.with_retry(
-                        module_name="InstagramPublish",
-                        scenario="Publishing video carousel to Instagram"
-                    )(self.uploadpost.publish_mixed_carousel)
-                    
                     logger.info("Calling publish_mixed_carousel...")
-                    result = await publish_with_retry(items, translated_caption)
+                    result = await self._publish_mixed_carousel(items, translated_caption)
                     logger.info(f"publish_mixed_carousel returned: {result}")
                     
                 except Exception as e:
@@ -202,90 +454,82 @@ class ContentProcessor:
                 logger.info("Publishing PHOTO carousel")
                 media_data_list = [data for data, _ in items]
                 
-                publish_with_retry = self.error_handler.with_retry(
-                    module_name="InstagramPublish",
-                    scenario="Publishing photo carousel to Instagram"
-                )(self.uploadpost.publish_carousel)
-                
-                await publish_with_retry(media_data_list, translated_caption)
+                await self._publish_photo_carousel(media_data_list, translated_caption)
             
             logger.info("Carousel published successfully to Instagram")
-            
-            del self.carousel_groups[media_group_id]
-            if media_group_id in self.carousel_captions:
-                del self.carousel_captions[media_group_id]
-            if media_group_id in self.carousel_timers:
-                del self.carousel_timers[media_group_id]
         
         except Exception as e:
             logger.error(f"Carousel publishing failed: {str(e)}")
             raise
     
+    async def _translate_video(self, source_path: str, dest_path: str):
+        """Convert with CloudConvert, translate with HeyGen and stream the result to dest_path"""
+        video_url = await self._convert_video(source_path, "video")
+        
+        logger.info(f"Video converted and hosted at: {video_url}")
+        
+        translated_video_url, _ = await self._heygen_translate(video_url)
+        
+        logger.info("Video translated with HeyGen (audio + lip sync)")
+        
+        session = get_session()
+        async with session.get(translated_video_url) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to download translated video: {response.status}")
+            with open(dest_path, 'wb') as dest_file:
+                # 1 MB writes can stall on dirty-page writeback: keep them off the event loop
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(dest_file.write, chunk)
+        
+        logger.info(f"Translated video downloaded: {os.path.getsize(dest_path)} bytes")
+    
+    async def _publish_reel_file(self, video_path: str, caption: str) -> dict:
+        """Publish a reel from disk; reopened per attempt so retries can re-stream it"""
+        with open(video_path, 'rb') as video_file:
+            return await self.uploadpost.publish_reel(video_file, caption, "reel.mp4")
+    
     async def process_video_with_caption(self, message: Message):
         logger.info(f"Processing video: {message.message_id}")
         
+        # Translate the caption while the video goes through the pipeline
+        caption_task = asyncio.create_task(self._cached_translation(message.caption, self._translate_caption))
+        caption_task.add_done_callback(self._consume_exception)
+        
         try:
-            file = await self.bot.get_file(message.video.file_id)
-            video_data = await file.download_as_bytearray()
-            
-            logger.info(f"Video downloaded: {len(video_data)} bytes")
-            
-            convert_with_retry = self.error_handler.with_retry(
-                module_name="CloudConvert",
-                scenario="Converting video to MP4 and getting URL"
-            )(self.cloudconvert.convert_video_to_mp4_url)
-            
-            video_url = await convert_with_retry(bytes(video_data), "video")
-            
-            logger.info(f"Video converted and hosted at: {video_url}")
-            
-            translate_with_retry = self.error_handler.with_retry(
-                module_name="HeyGenTranslation",
-                scenario="Translating video with HeyGen"
-            )(self.heygen.translate_video)
-            
-            translated_video_url, _ = await translate_with_retry(video_url)
-            
-            logger.info("Video translated with HeyGen (audio + lip sync)")
-            
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(translated_video_url) as response:
-                    if response.status != 200:
-                        raise Exception(f"Failed to download translated video: {response.status}")
-                    translated_video = await response.read()
-            
-            logger.info(f"Translated video downloaded: {len(translated_video)} bytes")
-            
-            subtitle_with_retry = self.error_handler.with_retry(
-                module_name="SubtitleGeneration",
-                scenario="Adding subtitles to translated video"
-            )(self.subtitle.add_subtitles_to_video)
-            
-            final_video = await subtitle_with_retry(translated_video)
-            
-            logger.info(f"Subtitles added to video: {len(final_video)} bytes")
-            
-            translate_caption_with_retry = self.error_handler.with_retry(
-                module_name="CaptionTranslation",
-                scenario="Translating video caption",
-                fallback_func=lambda: self.translation.translate_caption_openai_fallback(message.caption)
-            )(self.translation.translate_caption)
-            
-            translated_caption = await translate_caption_with_retry(message.caption)
-            
-            if len(translated_caption) > CAPTION_MAX_LENGTH:
-                translated_caption = translated_caption[:CAPTION_MAX_LENGTH-3] + "..."
-            
-            publish_with_retry = self.error_handler.with_retry(
-                module_name="InstagramPublish",
-                scenario="Publishing reel to Instagram"
-            )(self.uploadpost.publish_reel)
-            
-            await publish_with_retry(final_video, translated_caption, "reel.mp4")
-            
-            logger.info("Reel published successfully to Instagram")
+            with tempfile.TemporaryDirectory(prefix='reel_', dir=settings.temp_dir) as workdir:
+                source_path = os.path.join(workdir, 'source.mp4')
+                translated_path = os.path.join(workdir, 'translated.mp4')
+                final_path = os.path.join(workdir, 'final.mp4')
+                
+                await self._download_to_path(message.video.file_id, source_path)
+                source_size = os.path.getsize(source_path)
+                
+                logger.info(f"Video downloaded: {source_size} bytes")
+                
+                cached = False
+                if self.video_cache:
+                    cache_key = await self.video_cache.key(source_path)
+                    cached = await self.video_cache.get(cache_key, self.heygen.translation_params, translated_path)
+                
+                if not cached:
+                    await self._translate_video(source_path, translated_path)
+                    
+                    if self.video_cache:
+                        await self.video_cache.put(cache_key, self.heygen.translation_params, translated_path, source_size)
+                
+                await self._add_subtitles(translated_path, final_path)
+                
+                logger.info(f"Subtitles added to video: {os.path.getsize(final_path)} bytes")
+                
+                translated_caption = self._fit_caption(await caption_task)
+                
+                await self._publish_reel(final_path, translated_caption)
+                
+                logger.info("Reel published successfully to Instagram")
         
         except Exception as e:
             logger.error(f"Video processing failed: {str(e)}")
             raise
+        
+        finally:
+            caption_task.cancel()
@@ -3,9 +3,10 @@ Error handler with retry logic and exponential backoff
 """
 import logging
 import asyncio
+import random
 from functools import wraps
 from typing import Callable, Any, Optional
-from config import MAX_RETRIES, RETRY_DELAY
+from config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +15,8 @@ class ErrorHandler:
     """Handles errors with retry logic and exponential backoff"""
     
     def __init__(self):
-        self.max_retries = MAX_RETRIES
-        self.retry_delay = RETRY_DELAY
+        self.max_retries = settings.max_retries
+        self.retry_delay = settings.retry_delay
     
     def with_retry(
         self,
@@ -57,8 +58,11 @@ class ErrorHandler:
                         )
                         
                         if attempt < max_attempts:
-                            delay = self.retry_delay * (2 ** (attempt - 1))
-                            logger.info(f"Retrying in {delay} seconds...")
+                            # Equal jitter: half the backoff fixed, half random, so callers
+                            # that failed together (e.g. on a 429) don't retry in lockstep
+                            backoff = self.retry_delay * (2 ** (attempt - 1))
+                            delay = backoff / 2 + random.uniform(0, backoff / 2)
+                            logger.info(f"Retrying in {delay:.1f} seconds...")
                             await asyncio.sleep(delay)
                         else:
                             logger.error(
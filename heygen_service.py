@@ -3,8 +3,8 @@ HeyGen service for video translation with subtitle generation
 """
 import logging
 import asyncio
-import aiohttp
-from config import HEYGEN_API_KEY, HEYGEN_TIMEOUT, HEYGEN_POLL_INTERVAL
+from config import settings
+from http_session import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +13,15 @@ class HeyGenService:
     """Handles video translation using HeyGen API"""
     
     def __init__(self):
-        self.api_key = HEYGEN_API_KEY
+        self.api_key = settings.heygen_api_key
         self.base_url = "https://api.heygen.com/v2/video_translate"
+        # Also used as the video cache key params: changing them invalidates cached translations
+        self.translation_params = {
+            "output_language": "Spanish",
+            "speaker_num": 1,
+            "translate_audio_only": False,
+            "enable_caption": True  # Enable subtitles
+        }
     
     async def translate_video(self, video_url: str) -> tuple[str, str]:
         """
@@ -32,76 +39,70 @@ class HeyGenService:
             
             logger.info(f"Starting HeyGen video translation for URL: {video_url}")
             
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "X-Api-Key": self.api_key,
-                    "Accept": "application/json",
-                    "Content-Type": "application/json"
-                }
-                
-                # Step 1: Submit translation request with subtitle generation
-                payload = {
-                    "video_url": video_url,
-                    "output_language": "Spanish",
-                    "speaker_num": 1,
-                    "translate_audio_only": False,
-                    "enable_caption": True  # Enable subtitles
-                }
+            session = get_session()
+            headers = {
+                "X-Api-Key": self.api_key,
+                "Accept": "application/json",
+                "Content-Type": "application/json"
+            }
+            
+            # Step 1: Submit translation request with subtitle generation
+            payload = {"video_url": video_url, **self.translation_params}
+            
+            logger.info(f"Submitting HeyGen translation request with subtitles enabled")
+            
+            async with session.post(self.base_url, json=payload, headers=headers) as response:
+                if response.status not in [200, 202]:
+                    error_text = await response.text()
+                    raise Exception(f"HeyGen API error: {response.status} - {error_text}")
                 
-                logger.info(f"Submitting HeyGen translation request with subtitles enabled")
+                result = await response.json()
+            
+            video_translate_id = result.get('data', {}).get('video_translate_id')
+            
+            if not video_translate_id:
+                raise Exception(f"No video_translate_id in response: {result}")
+            
+            logger.info(f"HeyGen translation started: {video_translate_id}")
+            
+            # Step 2: Poll for completion
+            elapsed = 0
+            status_check_url = f"{self.base_url}/{video_translate_id}"
+            
+            while elapsed < settings.heygen_timeout:
+                await asyncio.sleep(settings.heygen_poll_interval)
+                elapsed += settings.heygen_poll_interval
                 
-                async with session.post(self.base_url, json=payload, headers=headers) as response:
-                    if response.status not in [200, 202]:
-                        error_text = await response.text()
-                        raise Exception(f"HeyGen API error: {response.status} - {error_text}")
+                async with session.get(status_check_url, headers=headers) as status_response:
+                    if status_response.status != 200:
+                        logger.warning(f"HeyGen status check failed: {status_response.status}")
+                        continue
                     
-                    result = await response.json()
+                    status_result = await status_response.json()
                 
-                video_translate_id = result.get('data', {}).get('video_translate_id')
+                if not status_result.get('data'):
+                    logger.warning(f"No data in status response")
+                    continue
                 
-                if not video_translate_id:
-                    raise Exception(f"No video_translate_id in response: {result}")
+                data = status_result['data']
+                status = data.get('status')
+                video_url_result = data.get('url')
                 
-                logger.info(f"HeyGen translation started: {video_translate_id}")
+                logger.info(f"HeyGen status: {status} (elapsed: {elapsed}s) - URL present: {bool(video_url_result)}")
                 
-                # Step 2: Poll for completion
-                elapsed = 0
-                status_check_url = f"{self.base_url}/{video_translate_id}"
+                if status in ['failed', 'error']:
+                    error = data.get('error_message', 'Unknown error')
+                    raise Exception(f"HeyGen translation failed: {error}")
                 
-                while elapsed < HEYGEN_TIMEOUT:
-                    await asyncio.sleep(HEYGEN_POLL_INTERVAL)
-                    elapsed += HEYGEN_POLL_INTERVAL
-                    
-                    async with session.get(status_check_url, headers=headers) as status_response:
-                        if status_response.status != 200:
-                            logger.warning(f"HeyGen status check failed: {status_response.status}")
-                            continue
-                        
-                        status_result = await status_response.json()
-                    
-                    if not status_result.get('data'):
-                        logger.warning(f"No data in status response")
-                        continue
+                if status in ['completed', 'success'] and video_url_result:
+                    logger.info(f"HeyGen translation completed with subtitles")
                     
-                    data = status_result['data']
-                    status = data.get('status')
-                    video_url_result = data.get('url')
+                    # HeyGen has embedded the subtitles in the video
+                    srt_content = ""
                     
-                    logger.info(f"HeyGen status: {status} (elapsed: {elapsed}s) - URL present: {bool(video_url_result)}")
-                    
-                    if status in ['failed', 'error']:
-                        error = data.get('error_message', 'Unknown error')
-                        raise Exception(f"HeyGen translation failed: {error}")
-                    
-                    if status in ['completed', 'success'] and video_url_result:
-                        logger.info(f"HeyGen translation completed with subtitles")
-                        
-                        # HeyGen has embedded the subtitles in the video
-                        srt_content = ""
-                        
-                        return video_url_result, srt_content
-                
-                raise TimeoutError(f"HeyGen translation timed out after {HEYGEN_TIMEOUT} seconds")
+                    return video_url_result, srt_content
+            
+            raise TimeoutError(f"HeyGen translation timed out after {settings.heygen_timeout} seconds")
         
         except Exception as e:
             logger.error(f"HeyGen video translation failed: {str(e)}")
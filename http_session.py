@@ -0,0 +1,47 @@
+"""
+Shared aiohttp session for all services
+"""
+import logging
+import aiohttp
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Return the application-wide ClientSession, creating it on first use
+
+    Must be called from inside the running event loop. Reusing one session
+    keeps TCP/TLS connections and DNS lookups pooled across requests.
+    """
+    global _session
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=64,
+                limit_per_host=16,
+                ttl_dns_cache=300,
+                keepalive_timeout=75
+            ),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60),
+            # Token-authenticated APIs only: skip cookie parsing/storage on every response
+            cookie_jar=aiohttp.DummyCookieJar()
+        )
+        logger.info("Shared HTTP session created")
+
+    return _session
+
+
+async def close_session():
+    """Close the shared session (call once on application shutdown)"""
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("Shared HTTP session closed")
+
+    _session = None
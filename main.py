@@ -3,28 +3,25 @@ Instagram Clone Bot - Main Application
 Monitors Telegram channel and publishes content to Instagram
 """
 import logging
-import asyncio
+from aiohttp import web
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 
-from config import (
-    TELEGRAM_BOT_TOKEN,
-    SOURCE_CHANNEL_ID,
-    LOG_LEVEL,
-    validate_config
-)
+from config import settings
 from error_handler import create_error_handler
 from translation_service import create_translation_service
 from heygen_service import create_heygen_service
 from cloudconvert_service import create_cloudconvert_service
 from subtitle_service import create_subtitle_service
 from uploadpost_service import create_uploadpost_service
+from video_cache import create_video_cache
 from content_processor import ContentProcessor
+from http_session import close_session
 
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, LOG_LEVEL)
+    level=getattr(logging, settings.log_level)
 )
 logger = logging.getLogger(__name__)
 
@@ -35,35 +32,73 @@ class InstagramCloneBot:
     def __init__(self):
         self.app = None
         self.content_processor = None
+        self.cloudconvert_service = None
+        self.translation_service = None
+        self.subtitle_service = None
+        self.webhook_runner = None
     
     def initialize_services(self):
         """Initialize all services"""
         logger.info("Initializing services...")
         
         # Validate configuration
-        validate_config()
+        settings.validate()
         
         # Initialize services
         error_handler = create_error_handler()
-        translation_service = create_translation_service()
+        self.translation_service = create_translation_service()
         heygen_service = create_heygen_service()
-        cloudconvert_service = create_cloudconvert_service()
-        subtitle_service = create_subtitle_service()
+        self.cloudconvert_service = create_cloudconvert_service()
+        self.subtitle_service = create_subtitle_service()
         uploadpost_service = create_uploadpost_service()
+        video_cache = create_video_cache()
         
         # Initialize content processor
         self.content_processor = ContentProcessor(
             bot=self.app.bot,
             error_handler=error_handler,
-            translation_service=translation_service,
+            translation_service=self.translation_service,
             heygen_service=heygen_service,
-            cloudconvert_service=cloudconvert_service,
-            subtitle_service=subtitle_service,
-            uploadpost_service=uploadpost_service
+            cloudconvert_service=self.cloudconvert_service,
+            subtitle_service=self.subtitle_service,
+            uploadpost_service=uploadpost_service,
+            video_cache=video_cache
         )
         
         logger.info("Services initialized successfully")
     
+    async def start_services(self, application: Application):
+        """Start background work that needs the running event loop"""
+        self.content_processor.start()
+        await self.start_webhook_server()
+    
+    async def start_webhook_server(self):
+        """Start the HTTP server receiving CloudConvert webhooks (if configured)"""
+        if not settings.cloudconvert_webhook_url:
+            return
+        
+        webhook_app = web.Application()
+        webhook_app.router.add_post('/cloudconvert/webhook', self.cloudconvert_service.handle_webhook)
+        
+        self.webhook_runner = web.AppRunner(webhook_app)
+        await self.webhook_runner.setup()
+        await web.TCPSite(self.webhook_runner, '0.0.0.0', settings.webhook_port).start()
+        
+        logger.info(f"CloudConvert webhook server listening on port {settings.webhook_port}")
+    
+    async def shutdown_services(self, application: Application):
+        """Release long-lived service resources on shutdown"""
+        await self.content_processor.close()
+        await self.translation_service.close()
+        await self.subtitle_service.close()
+        
+        if self.webhook_runner:
+            await self.webhook_runner.cleanup()
+        
+        await close_session()
+        
+        logger.info("Services shut down")
+    
     async def handle_channel_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle new posts in the monitored channel"""
         message = update.channel_post
@@ -72,7 +107,7 @@ class InstagramCloneBot:
             return
         
         # Check if message is from the source channel
-        if message.chat_id != SOURCE_CHANNEL_ID:
+        if message.chat_id != settings.source_channel_id:
             logger.debug(f"Ignoring message from channel {message.chat_id}")
             return
         
@@ -89,7 +124,14 @@ class InstagramCloneBot:
             logger.info("Starting Instagram Clone Bot...")
             
             # Create application
-            self.app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+            self.app = (
+                Application.builder()
+                .token(settings.telegram_bot_token)
+                .concurrent_updates(True)
+                .post_init(self.start_services)
+                .post_shutdown(self.shutdown_services)
+                .build()
+            )
             
             # Initialize services
             self.initialize_services()
@@ -105,7 +147,7 @@ class InstagramCloneBot:
                 )
             )
             
-            logger.info(f"Bot started. Monitoring channel: {SOURCE_CHANNEL_ID}")
+            logger.info(f"Bot started. Monitoring channel: {settings.source_channel_id}")
             logger.info("Press Ctrl+C to stop")
             
             # Start polling
@@ -1,28 +1,169 @@
 import logging
+import asyncio
+import fcntl
+import hashlib
+import io
+import json
 import os
 import tempfile
+import time
 import subprocess
+import httpx
+from types import SimpleNamespace
+from typing import Iterator, List, Optional
 from groq import AsyncGroq
-from config import (
-    GROQ_API_KEY,
-    SUBTITLE_FONT,
-    SUBTITLE_FONT_SIZE,
-    SUBTITLE_COLOR,
-    SUBTITLE_OUTLINE_COLOR,
-    SUBTITLE_OUTLINE_WIDTH,
-    SUBTITLE_MARGIN_V,
-    SUBTITLE_WORDS_PER_CHUNK
-)
+from config import settings
+from error_handler import create_error_handler
 
 logger = logging.getLogger(__name__)
 
+# Subtitle scripts up to the default Linux pipe capacity are handed to ffmpeg via /dev/fd,
+# when the pipe really holds them (it can be smaller: pipe-user-pages-soft, macOS)
+SUBTITLE_PIPE_MAX_BYTES = 1 << 16
+
+WHISPER_MODEL = "whisper-large-v3-turbo"
+
+# Groq client: fail fast on connect. The SDK doesn't retry: the ErrorHandler wrapper is the
+# only retry layer (with jitter), and each of its attempts is one request under whisper_timeout
+GROQ_TIMEOUT = httpx.Timeout(settings.whisper_timeout, connect=5.0)
+GROQ_MAX_RETRIES = 0
+
+# Expired transcripts are swept from the cache directory at most this often (seconds)
+TRANSCRIPT_CACHE_SWEEP_INTERVAL = 3600
+
+# 16 kHz mono is what Whisper resamples to anyway; speech-tuned 16 kbps Opus keeps
+# the upload small. The Ogg is streamed to stdout
+AUDIO_EXTRACT_ARGS = (
+    '-vn',
+    '-ac', '1',
+    '-ar', '16000',
+    '-c:a', 'libopus',
+    '-b:a', '16k',
+    '-application', 'voip',
+    '-f', 'ogg',
+    'pipe:1'
+)
+AUDIO_BYTES_PER_SECOND = 16000 // 8
+
+# StreamReader buffer for ffmpeg's stdout (piped audio is several MB)
+FFMPEG_PIPE_LIMIT = 1 << 20
+
+# Only the end of ffmpeg's stderr is kept (that's where errors are); a long encode logs megabytes
+FFMPEG_STDERR_TAIL = 1 << 16
+
+# Input videos are written to disk in slices of this size (os.write on a memoryview: no copies)
+FILE_WRITE_CHUNK = 4 << 20
+
+# Global flags for every ffmpeg run: never read the bot's stdin, no banner or progress lines,
+# warnings and errors only (a missing subtitle font is caught by the fc-list check at startup)
+FFMPEG_GLOBAL_ARGS = ['-hide_banner', '-nostdin', '-nostats', '-loglevel', 'warning']
+
+# Let ffmpeg use every core for decoding, filtering (libass rendering) and encoding
+FFMPEG_THREAD_ARGS = [
+    '-threads', '0',
+    '-filter_threads', str(os.cpu_count() or 1),
+    '-filter_complex_threads', str(os.cpu_count() or 1)
+]
+
+# Karaoke-style subtitles - CUSTOMIZABLE STYLE (settings are frozen, so build the header once).
+# Emitted as a native ASS script so libass reads the style directly instead of converting SRT;
+# PlayRes 384x288 is the canvas libass uses for SRT, so font sizes and margins are unchanged.
+ASS_HEADER = (
+    "[Script Info]\n"
+    "ScriptType: v4.00+\n"
+    "PlayResX: 384\n"
+    "PlayResY: 288\n"
+    "ScaledBorderAndShadow: yes\n"
+    "\n"
+    "[V4+ Styles]\n"
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+    "Alignment, MarginL, MarginR, MarginV, Encoding\n"
+    f"Style: Default,{settings.subtitle_font},{settings.subtitle_font_size},"
+    f"{settings.subtitle_color},{settings.subtitle_color},{settings.subtitle_outline_color},&H00000000,"
+    f"-1,0,0,0,100,100,0,0,1,{settings.subtitle_outline_width},0,"
+    f"2,10,10,{settings.subtitle_margin_v},0\n"
+    "\n"
+    "[Events]\n"
+    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+)
+
+# Reading-speed chunking: a cue stays up at least this long, and a pause longer than
+# SUBTITLE_MAX_GAP always starts a new cue
+SUBTITLE_MIN_DURATION = 0.5
+SUBTITLE_MAX_GAP = 0.4
+
+# Transcribed words are plain text: keep libass from reading braces/backslashes as override tags
+ASS_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '{': '\\{', '}': '\\}'})
+
+# Video encoder args for the burn-in, same size targets (~CRF 32, 1.5M cap) on each.
+# Hardware encoders are tried in order; libx264 is the CPU fallback.
+VIDEO_ENCODER_ARGS = {
+    'h264_nvenc': ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr', '-cq', '32', '-maxrate', '1.5M', '-bufsize', '1.5M'],
+    'h264_qsv': ['-c:v', 'h264_qsv', '-preset', 'medium', '-global_quality', '32', '-maxrate', '1.5M', '-bufsize', '1.5M'],
+    'h264_vaapi': ['-c:v', 'h264_vaapi', '-rc_mode', 'VBR', '-b:v', '1.2M', '-maxrate', '1.5M', '-bufsize', '1.5M'],
+    'h264_videotoolbox': ['-c:v', 'h264_videotoolbox', '-b:v', '1.2M', '-maxrate', '1.5M', '-bufsize', '1.5M'],
+    'libx264': ['-c:v', 'libx264', '-preset', settings.x264_preset, '-crf', '32', '-maxrate', '1.5M', '-bufsize', '1.5M'],
+}
+
+# VAAPI encodes from GPU surfaces: open the render node and upload the subtitled frames
+VIDEO_ENCODER_INPUT_ARGS = {
+    'h264_vaapi': ['-vaapi_device', settings.vaapi_device],
+}
+VIDEO_ENCODER_FILTERS = {
+    'h264_vaapi': 'format=nv12,hwupload',
+}
+
+# With a hardware encoder, decode on the GPU as well. Frames come back to system memory for
+# libass, and ffmpeg falls back to software decoding for streams the device can't handle.
+HWACCEL_DECODE_ARGS = ['-hwaccel', 'auto']
+
 
 class SubtitleService:
     
     def __init__(self):
-        if not GROQ_API_KEY:
-            raise ValueError("GROQ_API_KEY is not set in environment variables")
-        self.groq_client = AsyncGroq(api_key=GROQ_API_KEY)
+        self.local_whisper = self._load_local_whisper() if settings.whisper_backend == 'local' else None
+        
+        if self.local_whisper is not None:
+            self.groq_client = None
+            self.whisper_model = settings.whisper_local_model
+        else:
+            if not settings.groq_api_key:
+                raise ValueError("GROQ_API_KEY is not set in environment variables")
+            # One keep-alive pool for every transcription, sized to the Whisper concurrency cap
+            self.groq_client = AsyncGroq(
+                api_key=settings.groq_api_key,
+                timeout=GROQ_TIMEOUT,
+                max_retries=GROQ_MAX_RETRIES,
+                http_client=httpx.AsyncClient(
+                    timeout=GROQ_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=settings.whisper_max_concurrency,
+                        max_keepalive_connections=settings.whisper_max_concurrency
+                    )
+                )
+            )
+            self.whisper_model = WHISPER_MODEL
+        
+        self.sem_ffmpeg = asyncio.Semaphore(settings.ffmpeg_max_concurrency)
+        self.sem_whisper = asyncio.Semaphore(settings.whisper_max_concurrency)
+        self.transcript_swept_at = float('-inf')
+        
+        # Retries reuse the extracted audio bytes, so a timeout or exhausted 429 doesn't re-run ffmpeg.
+        # A local model isn't retried: it has no time budget, and a failed run would fail again
+        self._request_transcription_retrying = self._request_transcription
+        if self.local_whisper is None:
+            self._request_transcription_retrying = create_error_handler().with_retry(
+                module_name="Whisper",
+                scenario="Transcribing audio"
+            )(self._request_transcription)
+        
+        # Build/refresh fontconfig's cache once (a no-op when the image already did), so libass
+        # in every ffmpeg run loads the cache instead of scanning the font directories
+        try:
+            subprocess.run(['fc-cache'], capture_output=True, timeout=120)
+        except Exception as e:
+            logger.warning(f"Could not warm the fontconfig cache: {e}")
         
         # Log available fonts on startup for debugging
         try:
@@ -31,63 +172,339 @@ class SubtitleService:
             logger.info(f"Total fonts available: {len(available_fonts)}")
             
             # Check if our configured font is available
-            font_found = any(SUBTITLE_FONT.lower() in font.lower() for font in available_fonts)
+            font_found = any(settings.subtitle_font.lower() in font.lower() for font in available_fonts)
             if font_found:
-                logger.info(f"✅ Font '{SUBTITLE_FONT}' found in system!")
+                logger.info(f"✅ Font '{settings.subtitle_font}' found in system!")
             else:
-                logger.warning(f"⚠️ Font '{SUBTITLE_FONT}' NOT found! Available fonts logged below.")
+                logger.warning(f"⚠️ Font '{settings.subtitle_font}' NOT found! Available fonts logged below.")
                 logger.warning(f"Available fonts (first 20): {sorted(list(available_fonts))[:20]}")
         except Exception as e:
             logger.warning(f"Could not check available fonts: {e}")
+        
+        # Hand libass the font directory so the subtitle font is found without a fontconfig match
+        self.fonts_dir = settings.subtitle_fonts_dir if os.path.isdir(settings.subtitle_fonts_dir) else None
+        
+        self.video_encoder = self._detect_video_encoder()
+        logger.info(f"Subtitle burn-in encoder: {self.video_encoder}")
+        
+        # Everything in the burn-in command but the per-call paths is fixed once the encoder is known
+        self.burn_input_args = [
+            '/usr/bin/ffmpeg', *FFMPEG_GLOBAL_ARGS, *FFMPEG_THREAD_ARGS,
+            *VIDEO_ENCODER_INPUT_ARGS.get(self.video_encoder, []),
+            *(HWACCEL_DECODE_ARGS if self.video_encoder != 'libx264' else [])
+        ]
+        self.burn_output_args = [
+            *VIDEO_ENCODER_ARGS[self.video_encoder],
+            '-threads', '0',
+            '-c:a', 'aac',
+            '-b:a', '96k'
+        ]
+        self.burn_filter_options = f":fontsdir={self.fonts_dir}" if self.fonts_dir else ""
+        encoder_filter = VIDEO_ENCODER_FILTERS.get(self.video_encoder)
+        self.burn_filter_suffix = f",{encoder_filter}" if encoder_filter else ""
+    
+    async def close(self):
+        """Close the Groq client's connection pool (call once on shutdown)"""
+        if self.groq_client is not None:
+            await self.groq_client.close()
     
-    async def generate_srt_from_audio(self, video_path: str, language: str = "es") -> str:
+    @staticmethod
+    def _load_local_whisper():
+        """Load the faster-whisper model once, or None (falls back to Groq) if it's unavailable"""
         try:
-            logger.info(f"Generating word-by-word karaoke SRT with Groq Whisper: {video_path}")
-            
-            audio_path = video_path.replace('.mp4', '_audio.mp3')
+            from faster_whisper import WhisperModel
+        except ImportError:
+            logger.warning("WHISPER_BACKEND=local but faster-whisper is not installed, using Groq")
+            return None
+        
+        try:
+            model = WhisperModel(
+                settings.whisper_local_model,
+                device=settings.whisper_device,
+                compute_type=settings.whisper_compute_type
+            )
+        except Exception as e:
+            logger.warning(f"Could not load local Whisper model '{settings.whisper_local_model}', using Groq: {e}")
+            return None
+        
+        logger.info(f"Local Whisper model loaded: {settings.whisper_local_model} ({settings.whisper_device}, {settings.whisper_compute_type})")
+        return model
+    
+    @staticmethod
+    def _detect_video_encoder() -> str:
+        """Pick the first hardware H.264 encoder that ffmpeg lists and can actually open"""
+        if settings.video_encoder in VIDEO_ENCODER_ARGS:
+            return settings.video_encoder
+        if settings.video_encoder != 'auto':
+            logger.warning(f"Unknown VIDEO_ENCODER '{settings.video_encoder}', probing instead")
+        
+        try:
+            result = subprocess.run(
+                ['/usr/bin/ffmpeg', '-hide_banner', '-encoders'],
+                capture_output=True, text=True, timeout=10
+            )
             
-            extract_cmd = [
-                '/usr/bin/ffmpeg', '-i', video_path,
-                '-vn',
-                '-acodec', 'libmp3lame',
-                '-q:a', '2',
-                audio_path,
-                '-y'
+            for encoder in VIDEO_ENCODER_ARGS:
+                if encoder == 'libx264' or encoder not in result.stdout:
+                    continue
+                if encoder == 'h264_vaapi' and not os.path.exists(settings.vaapi_device):
+                    continue
+                
+                # Listed != usable (e.g. NVENC build without a GPU): encode a few blank frames
+                probe_filter = VIDEO_ENCODER_FILTERS.get(encoder)
+                probe = subprocess.run(
+                    ['/usr/bin/ffmpeg', '-hide_banner', *VIDEO_ENCODER_INPUT_ARGS.get(encoder, []),
+                     '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+                     *(['-vf', probe_filter] if probe_filter else []),
+                     '-c:v', encoder, '-f', 'null', '-'],
+                    capture_output=True, timeout=30
+                )
+                if probe.returncode == 0:
+                    return encoder
+        
+        except Exception as e:
+            logger.warning(f"Could not probe hardware encoders: {e}")
+        
+        return 'libx264'
+    
+    async def _run_ffmpeg(self, cmd: list, pass_fds: tuple = ()) -> subprocess.CompletedProcess:
+        """Run ffmpeg without blocking the event loop (at most sem_ffmpeg at once); the tail of stderr is returned as text"""
+        # The time budget starts once the slot is held: waiting behind other encodes is free
+        async with self.sem_ffmpeg, asyncio.timeout(settings.ffmpeg_timeout):
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                pass_fds=pass_fds,
+                limit=FFMPEG_PIPE_LIMIT
+            )
+            try:
+                stdout, stderr = await asyncio.gather(process.stdout.read(), self._read_tail(process.stderr))
+                await process.wait()
+            except asyncio.CancelledError:
+                # Timed out or cancelled: don't leave ffmpeg running
+                process.kill()
+                await process.wait()
+                raise
+        return subprocess.CompletedProcess(
+            cmd, process.returncode, stdout, stderr.decode('utf-8', errors='replace')
+        )
+    
+    @staticmethod
+    async def _read_tail(stream: asyncio.StreamReader) -> bytes:
+        """Drain stream to EOF, keeping only its last FFMPEG_STDERR_TAIL bytes"""
+        tail = bytearray()
+        while chunk := await stream.read(FFMPEG_PIPE_LIMIT):
+            tail += chunk
+            del tail[:-FFMPEG_STDERR_TAIL]
+        return bytes(tail)
+    
+    def _transcript_cache_path(self, audio_data: bytes, language: str) -> Optional[str]:
+        if not settings.transcript_cache_dir:
+            return None
+        key = hashlib.blake2b(audio_data, digest_size=16)
+        key.update(f"{self.whisper_model}:{language}".encode())
+        return os.path.join(settings.transcript_cache_dir, f"{key.hexdigest()}.json")
+    
+    @staticmethod
+    def _load_transcript(cache_path: str):
+        """Cached transcription (with .words like the API response), or None if missing/expired"""
+        try:
+            if time.time() - os.path.getmtime(cache_path) > settings.transcript_cache_ttl:
+                os.remove(cache_path)
+                return None
+            with open(cache_path, 'r', encoding='utf-8') as cache_file:
+                return SimpleNamespace(words=json.load(cache_file)['words'])
+        except FileNotFoundError:
+            return None
+    
+    @staticmethod
+    def _store_transcript(cache_path: str, words: list):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump({'words': words}, tmp_file)
+        os.replace(tmp_path, cache_path)
+    
+    @staticmethod
+    def _sweep_transcripts(cache_dir: str):
+        """Delete cached transcripts (and stray temp files) older than TRANSCRIPT_CACHE_TTL"""
+        cutoff = time.time() - settings.transcript_cache_ttl
+        removed = 0
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info(f"Transcript cache swept: {removed} expired entries removed")
+    
+    def _transcribe_local(self, audio_data: bytes, language: str) -> SimpleNamespace:
+        """Blocking faster-whisper transcription, shaped like the Groq response (.words dicts)"""
+        segments, _ = self.local_whisper.transcribe(io.BytesIO(audio_data), language=language, word_timestamps=True)
+        words = [
+            {'word': word.word, 'start': word.start, 'end': word.end}
+            for segment in segments
+            for word in segment.words
+        ]
+        return SimpleNamespace(words=words)
+    
+    async def _request_transcription_local(self, audio_data: bytes, language: str):
+        """
+        One faster-whisper run in a worker thread, under the concurrency cap
+        
+        No time budget: CPU runtime grows with the audio length, and a thread can't be
+        interrupted anyway. The Whisper slot is released when the thread finishes, not
+        when the caller stops waiting, so a cancelled job can't stack a new model run
+        on top of one that is still transcribing.
+        """
+        await self.sem_whisper.acquire()
+        try:
+            run = asyncio.ensure_future(asyncio.to_thread(self._transcribe_local, audio_data, language))
+        except BaseException:
+            self.sem_whisper.release()
+            raise
+        
+        def _release(task: asyncio.Future):
+            self.sem_whisper.release()
+            # Retrieve a failure nobody is left to await
+            if not task.cancelled():
+                task.exception()
+        
+        run.add_done_callback(_release)
+        return await asyncio.shield(run)
+    
+    async def _request_transcription(self, audio_data: bytes, language: str):
+        """One Whisper call, under the concurrency cap and the per-attempt time budget"""
+        if self.local_whisper is not None:
+            return await self._request_transcription_local(audio_data, language)
+        
+        async with self.sem_whisper, asyncio.timeout(settings.whisper_timeout):
+            return await self.groq_client.audio.transcriptions.create(
+                file=("audio.ogg", audio_data),
+                model=WHISPER_MODEL,
+                response_format="verbose_json",
+                language=language,
+                timestamp_granularities=["word"]
+            )
+    
+    async def _transcribe(self, audio_data: bytes, language: str):
+        cache_path = self._transcript_cache_path(audio_data, language)
+        
+        if cache_path:
+            try:
+                cached = await asyncio.to_thread(self._load_transcript, cache_path)
+                if cached:
+                    logger.info(f"Transcript cache hit: {os.path.basename(cache_path)}")
+                    return cached
+            except Exception as e:
+                logger.warning(f"Transcript cache read failed: {e}")
+        
+        transcription = await self._request_transcription_retrying(audio_data, language)
+        
+        if cache_path and getattr(transcription, 'words', None):
+            try:
+                await asyncio.to_thread(self._store_transcript, cache_path, transcription.words)
+            except Exception as e:
+                logger.warning(f"Transcript cache write failed: {e}")
+            
+            # Expired entries are otherwise only dropped when their exact key comes back
+            if time.monotonic() - self.transcript_swept_at > TRANSCRIPT_CACHE_SWEEP_INTERVAL:
+                self.transcript_swept_at = time.monotonic()
+                try:
+                    await asyncio.to_thread(self._sweep_transcripts, settings.transcript_cache_dir)
+                except Exception as e:
+                    logger.warning(f"Transcript cache sweep failed: {e}")
+        
+        return transcription
+    
+    async def _transcribe_segmented(self, audio_data: bytes, language: str) -> SimpleNamespace:
+        """
+        Split long audio into WHISPER_SEGMENT_SECONDS pieces and transcribe them in parallel
+        
+        Each piece is cut on an Opus packet boundary; ffmpeg's segment list reports its
+        exact start, which is added back to that piece's word timestamps.
+        """
+        with tempfile.TemporaryDirectory(prefix='audio_', dir=settings.temp_dir) as workdir:
+            audio_path = os.path.join(workdir, 'audio.ogg')
+            await asyncio.to_thread(self._write_file, audio_path, audio_data)
+            
+            split_cmd = [
+                '/usr/bin/ffmpeg', *FFMPEG_GLOBAL_ARGS, '-i', audio_path,
+                '-c', 'copy',
+                '-f', 'segment',
+                '-segment_time', str(settings.whisper_segment_seconds),
+                '-reset_timestamps', '1',
+                '-segment_list', 'pipe:1',
+                '-segment_list_type', 'csv',
+                os.path.join(workdir, 'part%03d.ogg')
             ]
             
-            result = subprocess.run(extract_cmd, capture_output=True, text=True)
+            result = await self._run_ffmpeg(split_cmd)
+            if result.returncode != 0:
+                raise Exception(f"FFmpeg audio split failed: {result.stderr}")
+            
+            parts = []
+            for line in result.stdout.decode().splitlines():
+                filename, start, _ = line.rsplit(',', 2)
+                part_data = await asyncio.to_thread(self._read_file, os.path.join(workdir, filename))
+                parts.append((float(start), part_data))
+        
+        logger.info(f"Transcribing {len(parts)} audio segments in parallel")
+        
+        # TaskGroup: the first failure cancels the sibling segments, so a retry of the whole
+        # stage doesn't run alongside orphans still holding Whisper slots and Groq quota
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(self._transcribe(data, language)) for _, data in parts]
+        except ExceptionGroup as errors:
+            raise errors.exceptions[0]
+        
+        transcriptions = [task.result() for task in tasks]
+        
+        words = [
+            {'word': word['word'], 'start': word['start'] + offset, 'end': word['end'] + offset}
+            for (offset, _), transcription in zip(parts, transcriptions)
+            for word in getattr(transcription, 'words', None) or []
+        ]
+        return SimpleNamespace(words=words)
+    
+    async def generate_ass_from_audio(self, video_path: str, language: str = "es") -> str:
+        try:
+            logger.info(f"Generating word-by-word karaoke ASS with Whisper ({self.whisper_model}): {video_path}")
+            
+            extract_cmd = ['/usr/bin/ffmpeg', *FFMPEG_GLOBAL_ARGS, '-threads', '0', '-i', video_path, *AUDIO_EXTRACT_ARGS]
+            
+            result = await self._run_ffmpeg(extract_cmd)
             if result.returncode != 0:
                 logger.error(f"FFmpeg extract audio failed: {result.stderr}")
                 raise Exception(f"FFmpeg audio extraction failed: {result.stderr}")
             
-            logger.info("Audio extracted successfully")
-            
-            with open(audio_path, 'rb') as audio_file:
-                transcription = await self.groq_client.audio.transcriptions.create(
-                    file=audio_file,
-                    model="whisper-large-v3-turbo",
-                    response_format="verbose_json",
-                    language=language,
-                    timestamp_granularities=["word"]
-                )
+            logger.info(f"Audio extracted successfully: {len(result.stdout)} bytes")
             
-            try:
-                os.remove(audio_path)
-            except:
-                pass
+            # Only the API backend benefits: a local model transcribes one piece at a time anyway
+            if (self.local_whisper is None and settings.whisper_segment_seconds
+                    and len(result.stdout) > settings.whisper_segment_seconds * AUDIO_BYTES_PER_SECOND):
+                transcription = await self._transcribe_segmented(result.stdout, language)
+            else:
+                transcription = await self._transcribe(result.stdout, language)
             
-            logger.info("Groq transcription completed with word-level timing")
+            logger.info("Transcription completed with word-level timing")
             
-            srt_content = self._create_karaoke_srt(transcription)
+            # Off the event loop: long transcripts mean thousands of cues
+            ass_content = await asyncio.to_thread(self._create_karaoke_ass, transcription)
             
-            logger.info(f"Karaoke SRT generated: {len(srt_content)} characters")
-            return srt_content
+            logger.info(f"Karaoke ASS generated: {len(ass_content)} characters")
+            return ass_content
         
         except Exception as e:
-            logger.error(f"SRT generation failed: {str(e)}")
+            logger.error(f"ASS generation failed: {str(e)}")
             raise
     
-    def _create_karaoke_srt(self, transcription) -> str:
+    def _create_karaoke_ass(self, transcription) -> str:
         """
         Create karaoke-style subtitles - 2 WORDS AT A TIME
         NO OVERLAP between chunks - each chunk finishes BEFORE the next starts
@@ -96,170 +513,291 @@ class SubtitleService:
             words = transcription.words if hasattr(transcription, 'words') else []
             
             if not words:
-                logger.error("No word-level timestamps from Groq")
+                logger.error("No word-level timestamps from Whisper")
                 raise Exception("No word-level timestamps available")
             
-            logger.info(f"Creating karaoke subtitles for {len(words)} words ({SUBTITLE_WORDS_PER_CHUNK} words per chunk, NO OVERLAP)")
+            logger.info(f"Creating karaoke subtitles for {len(words)} words ({settings.subtitle_words_per_chunk} words per chunk, NO OVERLAP)")
             
-            srt_lines = []
-            subtitle_index = 1
+            # Pull each field out of the word dicts once; the loops below only index flat lists
+            texts = [w['word'].strip() for w in words]
+            starts = [w['start'] for w in words]
+            ends = [w['end'] for w in words]
             
-            i = 0
-            while i < len(words):
-                # Get chunk of words (2 words)
-                chunk_size = min(SUBTITLE_WORDS_PER_CHUNK, len(words) - i)
-                chunk = words[i:i + chunk_size]
-                
-                # Get timing
-                start_time = chunk[0]['start']
-                end_time = chunk[-1]['end']
-                
-                # CRITICAL: Check if next chunk exists and avoid overlap
-                if i + chunk_size < len(words):
-                    next_chunk_start = words[i + chunk_size]['start']
-                    
-                    # If there's overlap, cut this chunk short by 50ms
-                    if end_time >= next_chunk_start:
-                        end_time = next_chunk_start - 0.05
-                        logger.debug(f"Chunk {subtitle_index}: adjusted end time to avoid overlap")
-                
-                # Ensure minimum duration of 0.5s per chunk
-                duration = end_time - start_time
-                if duration < 0.5:
-                    end_time = start_time + 0.5
-                    
-                    # Re-check overlap after adjustment
-                    if i + chunk_size < len(words):
-                        next_chunk_start = words[i + chunk_size]['start']
-                        if end_time >= next_chunk_start:
-                            end_time = next_chunk_start - 0.05
-                
-                # Create text - all UPPERCASE
-                text = ' '.join([w['word'].strip() for w in chunk]).upper()
-                
-                # Format SRT timestamps
-                start_srt = self._format_srt_time(start_time)
-                end_srt = self._format_srt_time(end_time)
-                
-                # Add to SRT
-                srt_lines.append(f"{subtitle_index}")
-                srt_lines.append(f"{start_srt} --> {end_srt}")
-                srt_lines.append(text)
-                srt_lines.append("")
-                
-                subtitle_index += 1
-                i += chunk_size
+            bounds = self._chunk_bounds(texts, starts, ends)
+            ass_content = ASS_HEADER + ''.join(self._iter_karaoke_cues(texts, starts, ends, bounds))
             
-            logger.info(f"Created {subtitle_index - 1} karaoke subtitle chunks (NO OVERLAP)")
-            return '\n'.join(srt_lines)
+            logger.info(f"Created {len(bounds) - 1} karaoke subtitle chunks (NO OVERLAP)")
+            return ass_content
         
         except Exception as e:
-            logger.error(f"Failed to create karaoke SRT: {str(e)}")
+            logger.error(f"Failed to create karaoke ASS: {str(e)}")
             raise
     
-    def _format_srt_time(self, seconds: float) -> str:
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+    @staticmethod
+    def _chunk_bounds(texts: List[str], starts: List[float], ends: List[float]) -> List[int]:
+        """
+        Index of the first word of every chunk, followed by the word count
+        
+        Fixed stride of SUBTITLE_WORDS_PER_CHUNK by default. With SUBTITLE_MAX_CPS set, a
+        chunk keeps taking words until it has at least that many words, lasts at least
+        SUBTITLE_MIN_DURATION and reads at or below the CPS limit; a pause or
+        SUBTITLE_MAX_CHARS ends it early. Fast speech gets fewer, longer cues.
+        """
+        chunk_size = settings.subtitle_words_per_chunk
+        
+        count = len(texts)
+        
+        if not settings.subtitle_max_cps:
+            return [*range(0, count, chunk_size), count]
+        
+        max_cps = settings.subtitle_max_cps
+        max_chars = settings.subtitle_max_chars
+        bounds = [0]
+        chunk_start = 0
+        chars = len(texts[0])
+        
+        for i in range(1, count):
+            previous_end = ends[i - 1]
+            duration = previous_end - starts[chunk_start]
+            word_chars = len(texts[i])
+            
+            readable = (
+                i - chunk_start >= chunk_size
+                and duration >= SUBTITLE_MIN_DURATION
+                and chars <= max_cps * duration
+            )
+            if (readable
+                    or starts[i] - previous_end > SUBTITLE_MAX_GAP
+                    or chars + 1 + word_chars > max_chars):
+                bounds.append(i)
+                chunk_start = i
+                chars = word_chars
+            else:
+                chars += 1 + word_chars
+        
+        bounds.append(count)
+        return bounds
     
-    async def add_subtitles_to_video(self, video_data: bytes, srt_content: str = None) -> bytes:
-        try:
-            logger.info(f"Adding karaoke subtitles to video: {len(video_data)} bytes ({len(video_data)/1024/1024:.2f} MB)")
+    def _iter_karaoke_cues(self, texts: List[str], starts: List[float], ends: List[float], bounds: List[int]) -> Iterator[str]:
+        """Yield one ASS Dialogue line per chunk of words (chunk i is texts[bounds[i]:bounds[i + 1]])"""
+        count = len(texts)
+        format_time = self._format_ass_time
+        
+        for subtitle_index, (i, j) in enumerate(zip(bounds, bounds[1:]), 1):
+            next_chunk_start = starts[j] if j < count else None
             
-            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as video_file:
-                video_file.write(video_data)
-                video_path = video_file.name
+            # Get timing
+            start_time = starts[i]
+            end_time = ends[j - 1]
             
-            logger.info(f"Video written to temp file: {video_path}")
+            # CRITICAL: If there's overlap with the next chunk, cut this one short by 50ms
+            if next_chunk_start is not None and end_time >= next_chunk_start:
+                end_time = next_chunk_start - 0.05
+                logger.debug(f"Chunk {subtitle_index}: adjusted end time to avoid overlap")
             
-            if not srt_content:
-                logger.info("No SRT provided, generating karaoke subtitles with Groq...")
-                srt_content = await self.generate_srt_from_audio(video_path, language="es")
+            # Ensure minimum duration of 0.5s per chunk
+            if end_time - start_time < 0.5:
+                end_time = start_time + 0.5
+                
+                # Re-check overlap after adjustment
+                if next_chunk_start is not None and end_time >= next_chunk_start:
+                    end_time = next_chunk_start - 0.05
             
-            srt_path = video_path.replace('.mp4', '.srt')
-            with open(srt_path, 'w', encoding='utf-8') as srt_file:
-                srt_file.write(srt_content)
+            # Create text - all UPPERCASE
+            text = ' '.join(texts[i:j]).upper().translate(ASS_TEXT_ESCAPES)
             
-            logger.info(f"SRT written to: {srt_path}")
+            yield f"Dialogue: 0,{format_time(start_time)},{format_time(end_time)},Default,,0,0,0,,{text}\n"
+    
+    @staticmethod
+    def _format_ass_time(seconds: float, _fmt="{:d}:{:02d}:{:02d}.{:02d}".format) -> str:
+        # Round once to integer centiseconds, then integer divmod (no truncation drift);
+        # the template's bound format is a default arg, so the hot path does no lookups
+        secs, centis = divmod(int(seconds * 100 + 0.5), 100)
+        minutes, secs = divmod(secs, 60)
+        hours, minutes = divmod(minutes, 60)
+        return _fmt(hours, minutes, secs, centis)
+    
+    @staticmethod
+    def _subtitle_pipe(ass_bytes: bytes) -> Optional[int]:
+        """
+        Return the read end of a pipe pre-filled with ass_bytes, or None if they don't fit
+        
+        Nobody reads the pipe until ffmpeg starts, so the write end is non-blocking: a
+        full pipe raises BlockingIOError instead of hanging the event loop.
+        """
+        read_fd, write_fd = os.pipe()
+        try:
+            set_pipe_size = getattr(fcntl, 'F_SETPIPE_SZ', None)
+            if set_pipe_size is not None:
+                try:
+                    fcntl.fcntl(write_fd, set_pipe_size, SUBTITLE_PIPE_MAX_BYTES)
+                except OSError:
+                    pass
+            os.set_blocking(write_fd, False)
+            
+            view = memoryview(ass_bytes)
+            while view:
+                view = view[os.write(write_fd, view):]
+        except BlockingIOError:
+            os.close(read_fd)
+            return None
+        except Exception:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        return read_fd
+    
+    async def add_subtitles_to_file(self, video_path: str, output_path: str, ass_content: str = None, hard_burn: bool = True) -> str:
+        """
+        Burn karaoke subtitles into the video at video_path
+        
+        Works on files end to end so the video never has to be held in memory.
+        The caller owns both video_path and output_path.
+        
+        With hard_burn=False the subtitles are muxed as a soft mov_text track instead:
+        video and audio are stream-copied, nothing is re-encoded (styling is lost, and
+        Instagram ignores soft subtitles, so reels must stay hard-burned).
+        
+        Returns:
+            output_path
+        """
+        ass_path = None
+        ass_fd = None
+        
+        try:
+            logger.info(f"Adding karaoke subtitles to video: {video_path}")
             
-            output_path = video_path.replace('.mp4', '_subtitled.mp4')
+            if not ass_content:
+                logger.info("No ASS script provided, generating karaoke subtitles with Whisper...")
+                ass_content = await self.generate_ass_from_audio(video_path, language="es")
             
-            # Karaoke-style subtitles - CUSTOMIZABLE STYLE
-            subtitle_style = (
-                f"FontName={SUBTITLE_FONT},"
-                f"FontSize={SUBTITLE_FONT_SIZE},"
-                f"Bold=1,"
-                f"PrimaryColour={SUBTITLE_COLOR},"
-                f"OutlineColour={SUBTITLE_OUTLINE_COLOR},"
-                f"BorderStyle=1,"
-                f"Outline={SUBTITLE_OUTLINE_WIDTH},"
-                f"Shadow=0,"
-                f"Alignment=2,"
-                f"MarginV={SUBTITLE_MARGIN_V}"
-            )
+            ass_bytes = ass_content.encode('utf-8')
             
-            logger.info(f"Adding karaoke-style subtitles (Font: {SUBTITLE_FONT}, Size: {SUBTITLE_FONT_SIZE}, {SUBTITLE_WORDS_PER_CHUNK} words per chunk)...")
-            
-            ffmpeg_cmd = [
-                '/usr/bin/ffmpeg', '-i', video_path,
-                '-vf', f"subtitles={srt_path}:force_style='{subtitle_style}'",
-                '-c:v', 'libx264',
-                '-preset', 'slow',
-                '-crf', '32',
-                '-maxrate', '1.5M',
-                '-bufsize', '1.5M',
-                '-c:a', 'aac',
-                '-b:a', '96k',
-                output_path,
-                '-y'
-            ]
+            if os.path.isdir('/dev/fd') and len(ass_bytes) <= SUBTITLE_PIPE_MAX_BYTES:
+                ass_fd = self._subtitle_pipe(ass_bytes)
             
-            result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
+            if ass_fd is not None:
+                subtitle_source = f"/dev/fd/{ass_fd}"
+                logger.info(f"ASS passed to FFmpeg via pipe: {subtitle_source}")
+            else:
+                ass_file_fd, ass_path = tempfile.mkstemp(suffix='.ass', dir=settings.temp_dir)
+                os.close(ass_file_fd)
+                await asyncio.to_thread(self._write_file, ass_path, ass_bytes)
+                subtitle_source = ass_path
+                logger.info(f"ASS written to: {ass_path}")
+            
+            if hard_burn:
+                logger.info(f"Adding karaoke-style subtitles (Font: {settings.subtitle_font}, Size: {settings.subtitle_font_size}, {settings.subtitle_words_per_chunk} words per chunk, encoder: {self.video_encoder})...")
+                
+                video_filter = f"subtitles={subtitle_source}{self.burn_filter_options}{self.burn_filter_suffix}"
+                
+                ffmpeg_cmd = [
+                    *self.burn_input_args,
+                    '-i', video_path,
+                    '-vf', video_filter,
+                    *self.burn_output_args,
+                    output_path,
+                    '-y'
+                ]
+            else:
+                logger.info("Muxing karaoke subtitles as a soft mov_text track (no re-encode)...")
+                
+                ffmpeg_cmd = [
+                    '/usr/bin/ffmpeg', *FFMPEG_GLOBAL_ARGS,
+                    '-i', video_path,
+                    '-i', subtitle_source,
+                    '-map', '0:v', '-map', '0:a?', '-map', '1:s',
+                    '-c', 'copy',
+                    '-c:s', 'mov_text',
+                    '-metadata:s:s:0', 'language=spa',
+                    output_path,
+                    '-y'
+                ]
+            
+            result = await self._run_ffmpeg(ffmpeg_cmd, pass_fds=(ass_fd,) if ass_fd is not None else ())
             if result.returncode != 0:
                 logger.error(f"FFmpeg subtitle addition failed: {result.stderr}")
                 raise Exception(f"FFmpeg failed: {result.stderr}")
             
-            # Log FFmpeg warnings about fonts
-            if 'fontconfig' in result.stderr.lower() or 'font' in result.stderr.lower():
-                logger.warning(f"FFmpeg font warnings: {result.stderr}")
-            
             logger.info("FFmpeg completed successfully")
             
-            with open(output_path, 'rb') as output_file:
-                subtitled_video = output_file.read()
-            
-            output_size_mb = len(subtitled_video) / 1024 / 1024
-            logger.info(f"Subtitled video size: {len(subtitled_video)} bytes ({output_size_mb:.2f} MB)")
+            output_size = os.path.getsize(output_path)
+            output_size_mb = output_size / 1024 / 1024
+            logger.info(f"Subtitled video size: {output_size} bytes ({output_size_mb:.2f} MB)")
             
             if output_size_mb > 100:
                 logger.warning(f"Video exceeds 100MB Instagram API limit! ({output_size_mb:.2f} MB)")
             
-            try:
-                os.remove(video_path)
-                os.remove(srt_path)
-                os.remove(output_path)
-                logger.info("Temp files cleaned up")
-            except Exception as cleanup_error:
-                logger.warning(f"Cleanup warning: {cleanup_error}")
+            logger.info(f"Karaoke subtitles added successfully: {output_path}")
+            return output_path
+        
+        except Exception as e:
+            logger.error(f"Adding subtitles failed: {str(e)}")
+            raise
+        
+        finally:
+            if ass_fd is not None:
+                os.close(ass_fd)
+            if ass_path:
+                self._remove_quietly(ass_path)
+    
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        """Write data in FILE_WRITE_CHUNK slices straight from the caller's buffer (no copies)"""
+        view = memoryview(data)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            offset = 0
+            while offset < len(view):
+                offset += os.write(fd, view[offset:offset + FILE_WRITE_CHUNK])
+        finally:
+            os.close(fd)
+    
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        """Read a whole file in one sized read (unbuffered: fstat, then no intermediate copies)"""
+        with open(path, 'rb', buffering=0) as raw_file:
+            return raw_file.read()
+    
+    @staticmethod
+    def _remove_quietly(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    async def add_subtitles_to_video(self, video_data: bytes, ass_content: str = None, hard_burn: bool = True) -> bytes:
+        """Bytes-in/bytes-out wrapper around add_subtitles_to_file"""
+        try:
+            logger.info(f"Adding karaoke subtitles to video: {len(video_data)} bytes ({len(video_data)/1024/1024:.2f} MB)")
             
-            logger.info(f"Karaoke subtitles added successfully: {len(subtitled_video)} bytes")
-            return subtitled_video
+            # One work dir for input and output: a single rmtree on exit, whatever happens
+            with tempfile.TemporaryDirectory(prefix='subs_', dir=settings.temp_dir) as workdir:
+                video_path = os.path.join(workdir, 'in.mp4')
+                output_path = os.path.join(workdir, 'out.mp4')
+                
+                await asyncio.to_thread(self._write_file, video_path, video_data)
+                
+                logger.info(f"Video written to temp file: {video_path}")
+                
+                await self.add_subtitles_to_file(video_path, output_path, ass_content, hard_burn)
+                
+                return await asyncio.to_thread(self._read_file, output_path)
         
         except Exception as e:
             logger.error(f"Adding subtitles failed: {str(e)}")
-            try:
-                if 'video_path' in locals() and os.path.exists(video_path):
-                    os.remove(video_path)
-                if 'srt_path' in locals() and os.path.exists(srt_path):
-                    os.remove(srt_path)
-                if 'output_path' in locals() and os.path.exists(output_path):
-                    os.remove(output_path)
-            except:
-                pass
             raise
 
 
+_instance: Optional[SubtitleService] = None
+
+
 def create_subtitle_service() -> SubtitleService:
-    return SubtitleService()
+    """Return the process-wide SubtitleService (its init probes fonts, encoders and models)"""
+    global _instance
+    
+    if _instance is None:
+        _instance = SubtitleService()
+    
+    return _instance
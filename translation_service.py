@@ -2,19 +2,39 @@
 Translation service using DeepL with OpenAI formatting
 """
 import logging
+import asyncio
 import deepl
+import httpx
 from openai import AsyncOpenAI
-from config import DEEPL_API_KEY, OPENAI_API_KEY
+from config import settings
 
 logger = logging.getLogger(__name__)
 
+# OpenAI fallback client: fail fast on connect; the SDK retries 429/5xx with exponential backoff
+OPENAI_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+OPENAI_MAX_RETRIES = 3
+
 
 class TranslationService:
     """Handles text translation from Italian to Spanish with HTML formatting"""
     
     def __init__(self):
-        self.deepl_translator = deepl.Translator(DEEPL_API_KEY)
-        self.openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        self.deepl_translator = deepl.Translator(settings.deepl_api_key)
+        # One client (and keep-alive pool) for the service's lifetime, sized to the OpenAI concurrency cap
+        self.openai_client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                timeout=OPENAI_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.openai_max_concurrency,
+                    max_keepalive_connections=settings.openai_max_concurrency
+                )
+            )
+        )
+        self.source_lang = "IT"
+        self.target_lang = "ES"
     
     async def translate_caption(self, text: str) -> str:
         """
@@ -27,12 +47,14 @@ class TranslationService:
             Translated and formatted caption in Spanish
         """
         try:
-            # Step 1: Translate with DeepL
+            # Step 1: Translate with DeepL (its client is blocking: run it in a worker thread
+            # so the event loop keeps serving, and the caller's timeout can abandon it)
             logger.info(f"Translating caption with DeepL: {text[:100]}...")
-            result = self.deepl_translator.translate_text(
+            result = await asyncio.to_thread(
+                self.deepl_translator.translate_text,
                 text,
-                source_lang="IT",
-                target_lang="ES"
+                source_lang=self.source_lang,
+                target_lang=self.target_lang
             )
             translated_text = result.text
             logger.info(f"DeepL translation: {translated_text[:100]}...")
@@ -84,6 +106,10 @@ class TranslationService:
         except Exception as e:
             logger.error(f"OpenAI fallback translation failed: {str(e)}")
             raise
+    
+    async def close(self):
+        """Close the OpenAI client's connection pool (call once on shutdown)"""
+        await self.openai_client.close()
 
 
 def create_translation_service() -> TranslationService:
@@ -1,20 +1,24 @@
 import logging
 import aiohttp
-from typing import List, Tuple
-from config import UPLOADPOST_API_TOKEN, UPLOADPOST_PROFILE, UPLOADPOST_API_URL
+from typing import AsyncIterable, BinaryIO, List, Tuple, Union
+from config import settings
+from http_session import get_session
 
 logger = logging.getLogger(__name__)
 
+# Upload-Post publishes to Instagram before responding, which can take minutes
+UPLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=600)
+
 
 class UploadPostService:
     
     def __init__(self):
-        self.api_token = UPLOADPOST_API_TOKEN
-        self.profile = UPLOADPOST_PROFILE
-        if '/api/upload' in UPLOADPOST_API_URL:
-            self.api_base_url = UPLOADPOST_API_URL.rsplit('/api/upload', 1)[0]
+        self.api_token = settings.uploadpost_api_token
+        self.profile = settings.uploadpost_profile
+        if '/api/upload' in settings.uploadpost_api_url:
+            self.api_base_url = settings.uploadpost_api_url.rsplit('/api/upload', 1)[0]
         else:
-            self.api_base_url = UPLOADPOST_API_URL.rstrip('/')
+            self.api_base_url = settings.uploadpost_api_url.rstrip('/')
         
         logger.info(f"Upload-Post base URL: {self.api_base_url}")
     
@@ -22,59 +26,59 @@ class UploadPostService:
         try:
             logger.info(f"Publishing photo to Instagram: {filename}")
             
-            async with aiohttp.ClientSession() as session:
-                form = aiohttp.FormData()
-                form.add_field('photos[]', image_data, filename=filename, content_type='image/jpeg')
-                form.add_field('title', caption[:100])
-                form.add_field('description', caption)
-                form.add_field('user', self.profile)
-                form.add_field('platform[]', 'instagram')
+            session = get_session()
+            form = aiohttp.FormData()
+            form.add_field('photos[]', image_data, filename=filename, content_type='image/jpeg')
+            form.add_field('title', caption[:100])
+            form.add_field('description', caption)
+            form.add_field('user', self.profile)
+            form.add_field('platform[]', 'instagram')
+            
+            headers = {
+                'Authorization': f'Apikey {self.api_token}'
+            }
+            
+            url = f"{self.api_base_url}/api/upload_photos"
+            logger.info(f"Sending request to: {url}")
+            
+            async with session.post(url, data=form, headers=headers, timeout=UPLOAD_TIMEOUT) as response:
+                response_status = response.status
+                response_text = await response.text()
                 
-                headers = {
-                    'Authorization': f'Apikey {self.api_token}'
-                }
+                logger.info(f"Upload-Post response status: {response_status}")
                 
-                url = f"{self.api_base_url}/api/upload_photos"
-                logger.info(f"Sending request to: {url}")
+                if response_status not in [200, 201]:
+                    logger.error(f"Upload-Post error response: {response_text}")
+                    raise Exception(f"Upload-Post API error: {response_status} - {response_text}")
                 
-                async with session.post(url, data=form, headers=headers) as response:
-                    response_status = response.status
-                    response_text = await response.text()
+                try:
+                    result = await response.json()
+                    logger.info(f"Upload-Post JSON response: {result}")
                     
-                    logger.info(f"Upload-Post response status: {response_status}")
+                    if isinstance(result, dict):
+                        if result.get('error') or result.get('status') == 'error':
+                            error_msg = result.get('message', result.get('error', 'Unknown error'))
+                            logger.error(f"Upload-Post returned error: {error_msg}")
+                            raise Exception(f"Upload-Post returned error: {error_msg}")
+                        
+                        instagram_result = result.get('results', {}).get('instagram', {})
+                        if not instagram_result.get('success'):
+                            error_msg = instagram_result.get('error', 'Unknown Instagram error')
+                            logger.error(f"Instagram upload failed: {error_msg}")
+                            raise Exception(f"Instagram upload failed: {error_msg}")
                     
-                    if response_status not in [200, 201]:
-                        logger.error(f"Upload-Post error response: {response_text}")
-                        raise Exception(f"Upload-Post API error: {response_status} - {response_text}")
+                    logger.info(f"Photo published successfully to Instagram")
+                    return result
                     
-                    try:
-                        result = await response.json()
-                        logger.info(f"Upload-Post JSON response: {result}")
-                        
-                        if isinstance(result, dict):
-                            if result.get('error') or result.get('status') == 'error':
-                                error_msg = result.get('message', result.get('error', 'Unknown error'))
-                                logger.error(f"Upload-Post returned error: {error_msg}")
-                                raise Exception(f"Upload-Post returned error: {error_msg}")
-                            
-                            instagram_result = result.get('results', {}).get('instagram', {})
-                            if not instagram_result.get('success'):
-                                error_msg = instagram_result.get('error', 'Unknown Instagram error')
-                                logger.error(f"Instagram upload failed: {error_msg}")
-                                raise Exception(f"Instagram upload failed: {error_msg}")
-                        
-                        logger.info(f"Photo published successfully to Instagram")
-                        return result
-                        
-                    except (ValueError, aiohttp.ContentTypeError) as e:
-                        logger.warning(f"Non-JSON response from Upload-Post: {e}")
-                        logger.info(f"Response text: {response_text}")
-                        
-                        if response_status in [200, 201]:
-                            logger.info(f"Photo published (non-JSON response)")
-                            return {"status": "success", "message": "Published", "response": response_text}
-                        else:
-                            raise Exception(f"Invalid response format: {response_text}")
+                except (ValueError, aiohttp.ContentTypeError) as e:
+                    logger.warning(f"Non-JSON response from Upload-Post: {e}")
+                    logger.info(f"Response text: {response_text}")
+                    
+                    if response_status in [200, 201]:
+                        logger.info(f"Photo published (non-JSON response)")
+                        return {"status": "success", "message": "Published", "response": response_text}
+                    else:
+                        raise Exception(f"Invalid response format: {response_text}")
         
         except Exception as e:
             logger.error(f"Failed to publish photo: {str(e)}")
@@ -84,62 +88,62 @@ class UploadPostService:
         try:
             logger.info(f"Publishing photo carousel to Instagram: {len(items_data)} photos")
             
-            async with aiohttp.ClientSession() as session:
-                form = aiohttp.FormData()
-                
-                for idx, image_data in enumerate(items_data):
-                    form.add_field('photos[]', image_data, filename=f'photo_{idx}.jpg', content_type='image/jpeg')
-                
-                form.add_field('title', caption[:100])
-                form.add_field('description', caption)
-                form.add_field('user', self.profile)
-                form.add_field('platform[]', 'instagram')
+            session = get_session()
+            form = aiohttp.FormData()
+            
+            for idx, image_data in enumerate(items_data):
+                form.add_field('photos[]', image_data, filename=f'photo_{idx}.jpg', content_type='image/jpeg')
+            
+            form.add_field('title', caption[:100])
+            form.add_field('description', caption)
+            form.add_field('user', self.profile)
+            form.add_field('platform[]', 'instagram')
+            
+            headers = {
+                'Authorization': f'Apikey {self.api_token}'
+            }
+            
+            url = f"{self.api_base_url}/api/upload_photos"
+            logger.info(f"Sending request to: {url}")
+            
+            async with session.post(url, data=form, headers=headers, timeout=UPLOAD_TIMEOUT) as response:
+                response_status = response.status
+                response_text = await response.text()
                 
-                headers = {
-                    'Authorization': f'Apikey {self.api_token}'
-                }
+                logger.info(f"Upload-Post response status: {response_status}")
                 
-                url = f"{self.api_base_url}/api/upload_photos"
-                logger.info(f"Sending request to: {url}")
+                if response_status not in [200, 201]:
+                    logger.error(f"Upload-Post error response: {response_text}")
+                    raise Exception(f"Upload-Post API error: {response_status} - {response_text}")
                 
-                async with session.post(url, data=form, headers=headers) as response:
-                    response_status = response.status
-                    response_text = await response.text()
+                try:
+                    result = await response.json()
+                    logger.info(f"Upload-Post JSON response: {result}")
                     
-                    logger.info(f"Upload-Post response status: {response_status}")
+                    if isinstance(result, dict):
+                        if result.get('error') or result.get('status') == 'error':
+                            error_msg = result.get('message', result.get('error', 'Unknown error'))
+                            logger.error(f"Upload-Post returned error: {error_msg}")
+                            raise Exception(f"Upload-Post returned error: {error_msg}")
+                        
+                        instagram_result = result.get('results', {}).get('instagram', {})
+                        if not instagram_result.get('success'):
+                            error_msg = instagram_result.get('error', 'Unknown Instagram error')
+                            logger.error(f"Instagram upload failed: {error_msg}")
+                            raise Exception(f"Instagram upload failed: {error_msg}")
                     
-                    if response_status not in [200, 201]:
-                        logger.error(f"Upload-Post error response: {response_text}")
-                        raise Exception(f"Upload-Post API error: {response_status} - {response_text}")
+                    logger.info(f"Photo carousel published successfully to Instagram")
+                    return result
                     
-                    try:
-                        result = await response.json()
-                        logger.info(f"Upload-Post JSON response: {result}")
-                        
-                        if isinstance(result, dict):
-                            if result.get('error') or result.get('status') == 'error':
-                                error_msg = result.get('message', result.get('error', 'Unknown error'))
-                                logger.error(f"Upload-Post returned error: {error_msg}")
-                                raise Exception(f"Upload-Post returned error: {error_msg}")
-                            
-                            instagram_result = result.get('results', {}).get('instagram', {})
-                            if not instagram_result.get('success'):
-                                error_msg = instagram_result.get('error', 'Unknown Instagram error')
-                                logger.error(f"Instagram upload failed: {error_msg}")
-                                raise Exception(f"Instagram upload failed: {error_msg}")
-                        
-                        logger.info(f"Photo carousel published successfully to Instagram")
-                        return result
-                        
-                    except (ValueError, aiohttp.ContentTypeError) as e:
-                        logger.warning(f"Non-JSON response from Upload-Post: {e}")
-                        logger.info(f"Response text: {response_text}")
-                        
-                        if response_status in [200, 201]:
-                            logger.info(f"Photo carousel published (non-JSON response)")
-                            return {"status": "success", "message": "Published", "response": response_text}
-                        else:
-                            raise Exception(f"Invalid response format: {response_text}")
+                except (ValueError, aiohttp.ContentTypeError) as e:
+                    logger.warning(f"Non-JSON response from Upload-Post: {e}")
+                    logger.info(f"Response text: {response_text}")
+                    
+                    if response_status in [200, 201]:
+                        logger.info(f"Photo carousel published (non-JSON response)")
+                        return {"status": "success", "message": "Published", "response": response_text}
+                    else:
+                        raise Exception(f"Invalid response format: {response_text}")
         
         except Exception as e:
             logger.error(f"Failed to publish photo carousel: {str(e)}")
@@ -214,63 +218,69 @@ class UploadPostService:
             logger.error(f"Failed to publish mixed carousel: {str(e)}")
             raise
     
-    async def publish_reel(self, video_data: bytes, caption: str, filename: str = "reel.mp4") -> dict:
+    async def publish_reel(self, video_data: Union[bytes, BinaryIO, AsyncIterable[bytes]], caption: str, filename: str = "reel.mp4") -> dict:
+        """
+        Publish a reel. video_data may be bytes, an open binary file or an
+        async iterator of chunks (e.g. CloudConvertService.convert_video_to_mp4);
+        files and iterators are streamed into the multipart body by aiohttp
+        without buffering the whole video.
+        """
         try:
             logger.info(f"Publishing reel to Instagram: {filename}")
             
-            async with aiohttp.ClientSession() as session:
-                form = aiohttp.FormData()
-                form.add_field('video', video_data, filename=filename, content_type='video/mp4')
-                form.add_field('title', caption[:100])
-                form.add_field('description', caption)
-                form.add_field('user', self.profile)
-                form.add_field('platform[]', 'instagram')
+            session = get_session()
+            form = aiohttp.FormData()
+            form.add_field('video', video_data, filename=filename, content_type='video/mp4')
+            form.add_field('title', caption[:100])
+            form.add_field('description', caption)
+            form.add_field('user', self.profile)
+            form.add_field('platform[]', 'instagram')
+            
+            headers = {
+                'Authorization': f'Apikey {self.api_token}'
+            }
+            
+            url = f"{self.api_base_url}/api/upload"
+            logger.info(f"Sending request to: {url}")
+            
+            async with session.post(url, data=form, headers=headers, timeout=UPLOAD_TIMEOUT) as response:
+                response_status = response.status
+                response_text = await response.text()
                 
-                headers = {
-                    'Authorization': f'Apikey {self.api_token}'
-                }
+                logger.info(f"Upload-Post response status: {response_status}")
                 
-                url = f"{self.api_base_url}/api/upload"
-                logger.info(f"Sending request to: {url}")
+                if response_status not in [200, 201]:
+                    logger.error(f"Upload-Post error response: {response_text}")
+                    raise Exception(f"Upload-Post API error: {response_status} - {response_text}")
                 
-                async with session.post(url, data=form, headers=headers) as response:
-                    response_status = response.status
-                    response_text = await response.text()
+                try:
+                    result = await response.json()
+                    logger.info(f"Upload-Post JSON response: {result}")
                     
-                    logger.info(f"Upload-Post response status: {response_status}")
+                    if isinstance(result, dict):
+                        if result.get('error') or result.get('status') == 'error':
+                            error_msg = result.get('message', result.get('error', 'Unknown error'))
+                            logger.error(f"Upload-Post returned error: {error_msg}")
+                            raise Exception(f"Upload-Post returned error: {error_msg}")
+                        
+                        instagram_result = result.get('results', {}).get('instagram', {})
+                        if not instagram_result.get('success'):
+                            error_msg = instagram_result.get('error', 'Unknown Instagram error')
+                            logger.error(f"Instagram upload failed: {error_msg}")
+                            raise Exception(f"Instagram upload failed: {error_msg}")
                     
-                    if response_status not in [200, 201]:
-                        logger.error(f"Upload-Post error response: {response_text}")
-                        raise Exception(f"Upload-Post API error: {response_status} - {response_text}")
+                    logger.info(f"Reel published successfully to Instagram")
+                    return result
                     
-                    try:
-                        result = await response.json()
-                        logger.info(f"Upload-Post JSON response: {result}")
-                        
-                        if isinstance(result, dict):
-                            if result.get('error') or result.get('status') == 'error':
-                                error_msg = result.get('message', result.get('error', 'Unknown error'))
-                                logger.error(f"Upload-Post returned error: {error_msg}")
-                                raise Exception(f"Upload-Post returned error: {error_msg}")
-                            
-                            instagram_result = result.get('results', {}).get('instagram', {})
-                            if not instagram_result.get('success'):
-                                error_msg = instagram_result.get('error', 'Unknown Instagram error')
-                                logger.error(f"Instagram upload failed: {error_msg}")
-                                raise Exception(f"Instagram upload failed: {error_msg}")
-                        
-                        logger.info(f"Reel published successfully to Instagram")
-                        return result
-                        
-                    except (ValueError, aiohttp.ContentTypeError) as e:
-                        logger.warning(f"Non-JSON response from Upload-Post: {e}")
-                        logger.info(f"Response text: {response_text}")
-                        
-                        if response_status in [200, 201]:
-                            logger.info(f"Reel published (non-JSON response)")
-                            return {"status": "success", "message": "Published", "response": response_text}
-                        else:
-                            raise Exception(f"Invalid response format: {response_text}")
+                except (ValueError, aiohttp.ContentTypeError) as e:
+                    logger.warning(f"Non-JSON response from Upload-Post: {e}")
+                    logger.info(f"Response text: {response_text}")
+                    
+                    if response_status in [200, 201]:
+                        logger.info(f"Reel published (non-JSON response)")
+                        return {"status": "success", "message": "Published", "response": response_text}
+                    else:
+                        raise Exception(f"Invalid response format: {response_text}")
         
         except Exception as e:
             logger.error(f"Failed to publish reel: {str(e)}")
@@ -0,0 +1,162 @@
+"""
+Content-addressable cache for translated videos
+"""
+import logging
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SUFFIX = '.translated.mp4'
+
+
+class VideoCache:
+    """
+    Caches HeyGen-translated videos keyed by the SHA-256 of the source video
+    
+    Layout (sharded to keep directories small):
+        <cache_dir>/ab/cd/<sha256>.translated.mp4
+        <cache_dir>/transforms/<sha256>.json   - params used to produce it
+    
+    A manifest whose params differ from the current ones is treated as a
+    miss, so changing the translation settings invalidates old entries.
+    
+    Every store prunes the least recently used videos (by mtime, refreshed
+    on each hit) until the cache fits in max_bytes.
+    """
+    
+    def __init__(self, cache_dir: str = settings.video_cache_dir, max_bytes: int = settings.video_cache_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+    
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        with open(path, 'rb') as video_file:
+            return hashlib.file_digest(video_file, 'sha256').hexdigest()
+    
+    async def key(self, video_path: str) -> str:
+        """SHA-256 of the source video file (hashed off the event loop)"""
+        return await asyncio.to_thread(self._hash_file, video_path)
+    
+    def _video_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], digest[2:4], f"{digest}{VIDEO_SUFFIX}")
+    
+    def _manifest_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, 'transforms', f"{digest}.json")
+    
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    
+    @staticmethod
+    def _link_or_copy(src: str, dst: str):
+        """Hardlink src to dst (no data copied), falling back to a copy across filesystems"""
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+    
+    def _read(self, digest: str, params: dict, dest_path: str) -> bool:
+        try:
+            with open(self._manifest_path(digest), 'r', encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+            
+            if manifest.get('params') != params:
+                logger.info(f"Video cache stale for {digest[:12]} (params changed)")
+                return False
+            
+            video_path = self._video_path(digest)
+            self._link_or_copy(video_path, dest_path)
+            os.utime(video_path)
+            return True
+        
+        except FileNotFoundError:
+            return False
+    
+    def _write(self, digest: str, params: dict, src_path: str, source_size: int):
+        # Video first, manifest last: a manifest only exists for a complete entry
+        video_path = self._video_path(digest)
+        os.makedirs(os.path.dirname(video_path), exist_ok=True)
+        
+        tmp_path = f"{video_path}.{uuid.uuid4().hex}.tmp"
+        self._link_or_copy(src_path, tmp_path)
+        os.replace(tmp_path, video_path)
+        
+        manifest = {
+            'heygen_output_oid': self._hash_file(video_path),
+            'source_size': source_size,
+            'params': params
+        }
+        self._atomic_write(self._manifest_path(digest), json.dumps(manifest).encode('utf-8'))
+        
+        self._prune()
+    
+    def _prune(self):
+        """Delete least recently used entries until the cached videos fit in max_bytes"""
+        entries = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(VIDEO_SUFFIX):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename[:-len(VIDEO_SUFFIX)], path))
+        
+        total = sum(size for _, size, _, _ in entries)
+        
+        for _, size, digest, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Manifest first: a video without a manifest is already a miss
+            for stale_path in (self._manifest_path(digest), path):
+                try:
+                    os.remove(stale_path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logger.info(f"Video cache evicted: {digest[:12]}")
+    
+    async def get(self, digest: str, params: dict, dest_path: str) -> bool:
+        """Materialize the cached translated video at dest_path; False on a miss"""
+        try:
+            hit = await asyncio.to_thread(self._read, digest, params, dest_path)
+        except Exception as e:
+            logger.warning(f"Video cache read failed for {digest[:12]}: {e}")
+            return False
+        
+        if hit:
+            logger.info(f"Video cache hit: {digest[:12]}")
+        return hit
+    
+    async def put(self, digest: str, params: dict, src_path: str, source_size: int):
+        """Store the translated video at src_path; failures are logged, never raised"""
+        try:
+            await asyncio.to_thread(self._write, digest, params, src_path, source_size)
+            logger.info(f"Video cache stored: {digest[:12]}")
+        except Exception as e:
+            logger.warning(f"Video cache write failed for {digest[:12]}: {e}")
+
+
+def create_video_cache() -> Optional[VideoCache]:
+    """Factory function to create a VideoCache (None when VIDEO_CACHE_DIR is empty)"""
+    if not settings.video_cache_dir:
+        return None
+    return VideoCache()